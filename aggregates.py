@@ -0,0 +1,399 @@
+"""
+Precomputed tables behind the Key Findings charts.
+
+The groupbys only depend on the listings file, so they are computed once per
+dataset version and written to Data/aggregates/<version>/ as one Parquet file
+per table. The app loads those small tables instead of grouping the full
+listings frame on every rerun.
+
+Build them ahead of a deploy with:
+
+    python aggregates.py
+"""
+
+import os
+import shutil
+import tempfile
+import threading
+
+import pandas as pd
+
+import data_loader
+import downsample
+import geo
+import leaderboard
+import price_stats
+import sql_backend
+import timeseries
+
+AGGREGATES_DIR = os.path.join(data_loader.DATA_DIR, "aggregates")
+
+# Largest number of points sent to the browser for the price scatter sample
+SCATTER_SAMPLE_SIZE = 5000
+
+# Boroughs in the order of the Reviews tabs
+BOROUGHS = ["Brooklyn", "Bronx", "Manhattan", "Queens", "Staten Island"]
+
+_loaded = {}
+_lock = threading.Lock()
+
+
+class Cube:
+    """
+    Sums of some measures over every combination of a few dimensions.
+
+    The cube is built with a single groupby and then answers any slice or
+    roll-up from its own small table, so a chart that needs the numbers for
+    one borough (or one room type, or one price range) never scans the
+    listings again. The table holds one row per combination of dimension
+    values, one column per measure and a "count" column with the number of
+    listings behind it.
+    """
+
+    def __init__(self, table, dims):
+        self.table = table
+        self.dims = list(dims)
+        self.measures = [c for c in table.columns if c not in self.dims]
+
+    @classmethod
+    def build(cls, data, dims, measures):
+        grouped = data.groupby(list(dims))
+        table = grouped[list(measures)].sum()
+        table["count"] = grouped.size()
+        return cls(table.reset_index(), dims)
+
+    def slice(self, **fixed):
+        """Rows for the given dimension values, summed over any dimension left over."""
+        mask = pd.Series(True, index=self.table.index)
+        for dim, value in fixed.items():
+            mask &= self.table[dim] == value
+        rest = [d for d in self.dims if d not in fixed]
+        return self._sum(self.table[mask], rest)
+
+    def rollup(self, *dims):
+        """Sum the cube down to the given dimensions."""
+        return self._sum(self.table, list(dims))
+
+    def mean(self, measure, *dims):
+        """Per-listing mean of a measure, rolled up to the given dimensions."""
+        rolled = self.rollup(*dims)
+        rolled[measure] = rolled[measure] / rolled["count"]
+        return rolled
+
+    def _sum(self, table, dims):
+        if not dims:
+            return table[self.measures].sum().to_frame().T
+        if dims == self.dims:
+            return table.reset_index(drop=True)
+        # Every combination is already in the cube, so keep categorical
+        # dimensions grouped on their observed values only
+        return table.groupby(dims, observed=True)[self.measures].sum().reset_index()
+
+
+def borough_reviews(reviews_cube, borough):
+    """Total reviews per price range for one borough, as shown in its tab."""
+    table = reviews_cube.slice(borough=borough)[["price_range", "number_of_reviews"]]
+    return table.sort_values("number_of_reviews", ascending=False)
+
+
+def map_table(level):
+    return "map_" + level.lower()
+
+
+def map_cells_table(level):
+    return "map_cells_" + level.lower()
+
+
+# Section name -> (builder, names of the tables it returns). Each section is
+# computed and stored on its own, so opening one part of the report never
+# pays for the others.
+SECTIONS = {}
+
+
+def section(name, tables):
+    def register(builder):
+        SECTIONS[name] = (builder, list(tables))
+        return builder
+    return register
+
+
+@section("map", [map_table(level) for level in geo.ZOOM_LEVELS])
+def build_map(data):
+    # Listings clustered on a grid for each detail level
+    return {map_table(level): clusters for level, clusters in geo.build_levels(data).items()}
+
+
+@section("price", ["price_stats"])
+def build_price(data):
+    # Summary statistics overall and per borough and room type
+    return {"price_stats": price_stats.stats_table(data)}
+
+
+@section("scatter", ["scatter_correlation", "scatter_bins", "scatter_sample"])
+def build_scatter(data):
+    # Booked Days 365 & Price, binned and sampled so the page stays small
+    scatter_sample = downsample.stratified_sample(data[["booked_days_365", "price", "borough"]], "borough", SCATTER_SAMPLE_SIZE)
+    return {
+        "scatter_correlation": pd.DataFrame({"correlation": [data["booked_days_365"].corr(data["price"])]}),
+        "scatter_bins": downsample.bin_2d(data, "booked_days_365", "price", color="borough", y_log=True),
+        "scatter_sample": scatter_sample.reset_index(drop=True),
+    }
+
+
+@section("room_types", ["room_types_counts", "room_types_avg_price"])
+def build_room_types(data):
+    aggs = {}
+    room_types_counts = data.groupby("room_type", as_index=False)["listing_id"].count()
+    aggs["room_types_counts"] = room_types_counts.rename(columns={"listing_id": "total_listings"})
+
+    room_types_avg_price = data.groupby("room_type")["price"].mean().reset_index()
+    aggs["room_types_avg_price"] = room_types_avg_price.rename(columns={"price": "avg_price"})
+    return aggs
+
+
+@section("boroughs", ["pie_data_listings", "pie_data_yearly_reveneue", "neighbourhood_leaderboard"])
+def build_boroughs(data):
+    aggs = {}
+    aggs["pie_data_listings"] = data.groupby("borough")["listing_id"].count().reset_index().sort_values("listing_id", ascending=False)
+
+    aggs["pie_data_yearly_reveneue"] = data.groupby("borough")["annual_revenue"].sum().reset_index().sort_values("annual_revenue", ascending=False)
+
+    # Ranked on demand by leaderboard.Leaderboard, so no sorting here
+    aggs["neighbourhood_leaderboard"] = leaderboard.build(data)
+    return aggs
+
+
+@section("price_ranges", ["price_ranges_by_listing_count", "price_ranges_by_price"])
+def build_price_ranges(data):
+    aggs = {}
+    price_ranges_by_listing_count = data.groupby("price_range", as_index=False)["listing_id"].count().sort_values(by="listing_id", ascending=False)
+    aggs["price_ranges_by_listing_count"] = price_ranges_by_listing_count.rename(columns={"listing_id": "total_listings"})
+
+    price_ranges_by_price = data.groupby(by=["price_range"], as_index=False)["booked_days_365"].mean().sort_values(by="booked_days_365", ascending=False)
+    aggs["price_ranges_by_price"] = price_ranges_by_price.rename(columns={"booked_days_365": "total_booked_days"})
+    return aggs
+
+
+# Booked days over time are rolled up per room type and per price range
+TIMESERIES_DIMS = ["room_type", "price_range"]
+
+
+def timeseries_tables(daily):
+    """Day to quarter rollups from a frame of booked days per (last_review, room_type, price_range)."""
+    return {timeseries.rollup_name(dim): timeseries.rollup(daily, dim) for dim in TIMESERIES_DIMS}
+
+
+@section("timeseries", [timeseries.rollup_name(dim) for dim in TIMESERIES_DIMS])
+def build_timeseries(data):
+    # The same daily state the filtered and incremental paths roll up, so the series agree
+    return timeseries_tables(build_daily(data))
+
+
+@section("reviews", ["reviews_cube", "all_boroughs"])
+def build_reviews(data):
+    # One (price_range, borough) cube feeds the overview and every borough tab
+    reviews_cube = Cube.build(data, ["price_range", "borough"], ["number_of_reviews"])
+
+    all_boroughs = reviews_cube.table[["price_range", "borough", "number_of_reviews"]].sort_values("number_of_reviews", ascending=True)
+    return {
+        "reviews_cube": reviews_cube.table,
+        "all_boroughs": all_boroughs.rename(columns={"number_of_reviews": "total_reviews"}),
+    }
+
+
+# Additive state behind the Room Types, Boroughs, Price Ranges and Reviews
+# tables. Every one of those tables is a roll-up of these two cubes, so an
+# incremental refresh only has to patch the cubes with the changed listings
+# (see refresh.py) instead of grouping the whole dataset again.
+STATE_DIMS = ["borough", "neighbourhood", "room_type", "price_range"]
+STATE_MEASURES = ["price", "booked_days_365", "number_of_reviews", "annual_revenue"]
+DAILY_DIMS = ["last_review", "room_type", "price_range"]
+DAILY_MEASURES = ["booked_days_365"]
+
+# Sections whose tables derive_from_state can rebuild
+STATE_SECTIONS = ["room_types", "boroughs", "price_ranges", "timeseries", "reviews"]
+
+
+def build_state(data):
+    """Sums and counts per (borough, neighbourhood, room_type, price_range) and per day."""
+    grouped = data.groupby(STATE_DIMS, observed=True, dropna=False)
+    state_cube = grouped[STATE_MEASURES].sum()
+    state_cube["count"] = grouped.size()
+
+    return {"state_cube": state_cube.reset_index(), "state_daily": build_daily(data)}
+
+
+def build_daily(data):
+    """Sums and counts per (last_review, room_type, price_range), missing values included."""
+    grouped = data.groupby(DAILY_DIMS, observed=True, dropna=False)
+    state_daily = grouped[DAILY_MEASURES].sum()
+    state_daily["count"] = grouped.size()
+    return state_daily.reset_index()
+
+
+section("state", ["state_cube", "state_daily"])(build_state)
+
+
+# The map clusters and price statistics come from these additive tables in
+# the same way, so a refresh patches them too instead of reading every listing.
+@section("map_cells", [map_cells_table(level) for level in geo.ZOOM_LEVELS])
+def build_map_cells(data):
+    return {map_cells_table(level): geo.cell_sums(data, cell_size) for level, cell_size in geo.ZOOM_LEVELS.items()}
+
+
+@section("price_counts", ["price_counts"])
+def build_price_counts(data):
+    return {"price_counts": price_stats.value_counts(data)}
+
+
+def derive_from_state(state_cube, state_daily):
+    """Rebuild the tables of STATE_SECTIONS from the state cubes alone."""
+    aggs = {}
+
+    def sums(key, columns):
+        return state_cube.groupby(key)[columns].sum()
+
+    # Room Types
+    room_types = sums("room_type", ["price", "count"])
+    aggs["room_types_counts"] = room_types["count"].rename("total_listings").reset_index()
+    aggs["room_types_avg_price"] = (room_types["price"] / room_types["count"]).rename("avg_price").reset_index()
+
+    # Boroughs & neighbourhoods
+    boroughs = sums("borough", ["annual_revenue", "count"])
+    aggs["pie_data_listings"] = boroughs["count"].rename("listing_id").reset_index().sort_values("listing_id", ascending=False)
+    aggs["pie_data_yearly_reveneue"] = boroughs["annual_revenue"].reset_index().sort_values("annual_revenue", ascending=False)
+
+    totals = state_cube.groupby(["borough", "neighbourhood"], observed=True)[["annual_revenue", "price", "booked_days_365", "count"]].sum()
+    aggs["neighbourhood_leaderboard"] = leaderboard.from_sums(totals.reset_index())
+
+    # Price Ranges
+    price_ranges = sums("price_range", ["booked_days_365", "count"])
+    aggs["price_ranges_by_listing_count"] = price_ranges["count"].rename("total_listings").reset_index().sort_values(by="total_listings", ascending=False)
+    aggs["price_ranges_by_price"] = (price_ranges["booked_days_365"] / price_ranges["count"]).rename("total_booked_days").reset_index().sort_values(by="total_booked_days", ascending=False)
+
+    # Booked days over time
+    aggs.update(timeseries_tables(state_daily))
+
+    # Reviews
+    reviews = state_cube.groupby(["price_range", "borough"])[["number_of_reviews", "count"]].sum()
+    reviews_cube = Cube(reviews.reset_index(), ["price_range", "borough"])
+    all_boroughs = reviews_cube.table[["price_range", "borough", "number_of_reviews"]].sort_values("number_of_reviews", ascending=True)
+    aggs["reviews_cube"] = reviews_cube.table
+    aggs["all_boroughs"] = all_boroughs.rename(columns={"number_of_reviews": "total_reviews"})
+    return aggs
+
+
+def section_of(name):
+    """The name of the section that builds table name."""
+    for section_name, (_, names) in SECTIONS.items():
+        if name in names:
+            return section_name
+    raise KeyError(name)
+
+
+def build_aggregates(data):
+    """Compute every Key Findings table from the listings frame."""
+    aggs = {}
+    for builder, _ in SECTIONS.values():
+        aggs.update(builder(data))
+    return aggs
+
+
+def aggregates_path(version):
+    return os.path.join(AGGREGATES_DIR, version)
+
+
+def write_tables(tables, version):
+    """Write tables into the store for one dataset version, one file each."""
+    target = aggregates_path(version)
+    os.makedirs(target, exist_ok=True)
+    for name, table in tables.items():
+        # Write next to the final name and rename, so readers never see half a file
+        fd, tmp_path = tempfile.mkstemp(dir=target, prefix=".tmp-", suffix=".parquet")
+        os.close(fd)
+        try:
+            table.to_parquet(tmp_path, index=False)
+            os.replace(tmp_path, os.path.join(target, name + ".parquet"))
+        except BaseException:
+            os.remove(tmp_path)
+            raise
+    return target
+
+
+def write_aggregates(aggs, version):
+    """Write every table for one dataset version, replacing any earlier copy."""
+    target = aggregates_path(version)
+    if os.path.isdir(target):
+        shutil.rmtree(target)
+    return write_tables(aggs, version)
+
+
+def read_table(version, name):
+    path = os.path.join(aggregates_path(version), name + ".parquet")
+    if not os.path.exists(path):
+        return None
+    return pd.read_parquet(path)
+
+
+class AggregateStore:
+    """
+    Key Findings tables for one dataset version, loaded on first access.
+
+    Looking up a table reads its file from the store, or, when the store has
+    not been built for this version, computes just the section that table
+    belongs to and writes it there.
+    """
+
+    def __init__(self, version):
+        self.version = version
+        self._tables = {}
+        self._lock = threading.Lock()
+
+    def __getitem__(self, name):
+        table = self._tables.get(name)
+        if table is not None:
+            return table
+
+        with self._lock:
+            if name not in self._tables:
+                self._load_section(section_of(name))
+            return self._tables[name]
+
+    def __contains__(self, name):
+        return any(name in names for _, names in SECTIONS.values())
+
+    def _load_section(self, section_name):
+        builder, names = SECTIONS[section_name]
+        tables = {name: read_table(self.version, name) for name in names}
+        if any(table is None for table in tables.values()):
+            if sql_backend.enabled():
+                tables = sql_backend.build_section(section_name)
+            else:
+                tables = builder(data_loader.load_listings())
+            try:
+                write_tables(tables, self.version)
+            except OSError:
+                # A read-only deploy still works, it just rebuilds per process
+                pass
+        self._tables.update(tables)
+
+
+def load_aggregates():
+    """
+    Return the Key Findings tables for the current listings file.
+
+    The store is shared by every session until the listings file changes.
+    Tables are read or computed section by section as they are first used.
+    """
+    version = data_loader.dataset_version()
+    with _lock:
+        if version not in _loaded:
+            _loaded.clear()
+            _loaded[version] = AggregateStore(version)
+        return _loaded[version]
+
+
+if __name__ == "__main__":
+    version = data_loader.dataset_version()
+    path = write_aggregates(build_aggregates(data_loader.load_listings()), version)
+    print(f"Wrote aggregates for {data_loader.LISTINGS_FILE} ({version}) to {path}")
@@ -0,0 +1,181 @@
+"""
+Local JSON API over the Key Findings tables.
+
+    python api.py [--host HOST] [--port PORT]
+
+Serves the aggregates the dashboard draws, from the same stores:
+
+    GET /api/tables                 names of the tables and the dataset version
+    GET /api/tables/<name>          one table as a list of records
+    GET /api/neighbourhoods/top     ranked neighbourhoods, ?metric=Revenue&k=10&within=Queens
+
+Every endpoint takes the sidebar filters as query parameters, repeated for
+several values: borough, neighbourhood, room_type, price_range, and
+last_review twice for a date window (?last_review=2019-01-01&last_review=2019-03-01).
+Unfiltered tables come from the on-disk aggregate store the dashboard reads
+too, so they are computed once for both; filtered views are built and kept
+as in the dashboard (see filters.filtered_aggregates).
+
+Each response carries an ETag made of the store version (the dataset version,
+plus the filters) and the request. A client that sends it back in
+If-None-Match gets 304 Not Modified until the listings file changes, which is
+answered before any table is looked up. Response bodies are kept in a small
+LRU cache, so a repeated request does not serialise the table again.
+"""
+
+import argparse
+import datetime
+import hashlib
+import http
+import http.server
+import json
+import urllib.parse
+
+import aggregates
+import filters
+import leaderboard
+import lru
+
+DEFAULT_HOST = "127.0.0.1"
+DEFAULT_PORT = 8502
+
+# Total size of the response bodies kept
+RESPONSE_CACHE_BYTES = 16 * 1024 * 1024
+
+_bodies = lru.LRUCache(RESPONSE_CACHE_BYTES)
+
+
+class RequestError(Exception):
+    """A request the API cannot answer, with the HTTP status to answer it with."""
+
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+
+
+def parse_selection(query):
+    """The filters in a parsed query string, in the form filters.sidebar returns."""
+    selection = {column: query.get(column, []) for column in filters.FILTER_COLUMNS}
+    selection[filters.DATE_COLUMN] = None
+    dates = query.get(filters.DATE_COLUMN)
+    if dates:
+        try:
+            start, end = (datetime.date.fromisoformat(date) for date in dates)
+        except ValueError:
+            raise RequestError(http.HTTPStatus.BAD_REQUEST, "last_review takes two dates, YYYY-MM-DD")
+        selection[filters.DATE_COLUMN] = (start, end)
+    return selection
+
+
+def _store(selection):
+    aggs = filters.filtered_aggregates(selection)
+    if aggs is None:
+        raise RequestError(http.HTTPStatus.NOT_FOUND, "No listings match these filters")
+    return aggs
+
+
+def _records(table):
+    return json.loads(table.to_json(orient="records", date_format="iso", double_precision=15))
+
+
+def list_tables(selection, query):
+    names = [name for _, tables in aggregates.SECTIONS.values() for name in tables]
+    return {"version": filters.view_version(selection), "tables": names}
+
+
+def get_table(selection, query, name):
+    try:
+        aggregates.section_of(name)
+    except KeyError:
+        raise RequestError(http.HTTPStatus.NOT_FOUND, f"No table named {name}")
+    return _records(_store(selection)[name])
+
+
+def top_neighbourhoods(selection, query):
+    metric = query.get("metric", ["Revenue"])[0]
+    # The metric can be given by its label or its column
+    column = leaderboard.METRICS.get(metric, metric)
+    if column not in leaderboard.METRICS.values():
+        raise RequestError(http.HTTPStatus.BAD_REQUEST, f"metric must be one of {', '.join(leaderboard.METRICS)}")
+    try:
+        k = int(query.get("k", ["10"])[0])
+    except ValueError:
+        raise RequestError(http.HTTPStatus.BAD_REQUEST, "k must be a number")
+    # Not "borough", which filters the listings the ranking is computed from
+    borough = query.get("within", [None])[0]
+    board = leaderboard.Leaderboard(_store(selection)["neighbourhood_leaderboard"])
+    return _records(board.top(column, max(k, 0), borough))
+
+
+def route(path):
+    """The handler for a path and its extra arguments."""
+    parts = [part for part in path.split("/") if part]
+    if parts == ["api", "tables"]:
+        return list_tables, ()
+    if len(parts) == 3 and parts[:2] == ["api", "tables"]:
+        return get_table, (parts[2],)
+    if parts == ["api", "neighbourhoods", "top"]:
+        return top_neighbourhoods, ()
+    raise RequestError(http.HTTPStatus.NOT_FOUND, f"No endpoint at {path}")
+
+
+def etag(version, path, query):
+    """Entity tag of a response: the store version and the normalised request."""
+    request = repr((path, sorted((name, tuple(values)) for name, values in query.items())))
+    return f'"{version}-{hashlib.sha1(request.encode()).hexdigest()[:12]}"'
+
+
+class Handler(http.server.BaseHTTPRequestHandler):
+
+    def do_GET(self):
+        url = urllib.parse.urlsplit(self.path)
+        query = urllib.parse.parse_qs(url.query)
+        try:
+            handler, args = route(url.path)
+            selection = parse_selection(query)
+            tag = etag(filters.view_version(selection), url.path, query)
+            if tag in [t.strip() for t in self.headers.get("If-None-Match", "").split(",")]:
+                self._send(http.HTTPStatus.NOT_MODIFIED, None, tag)
+                return
+
+            body = _bodies.get(tag)
+            if body is None:
+                body = json.dumps(handler(selection, query, *args))
+                _bodies.put(tag, body)
+            self._send(http.HTTPStatus.OK, body, tag)
+        except RequestError as e:
+            self._send(e.status, json.dumps({"error": str(e)}))
+
+    def _send(self, status, body, tag=None):
+        self.send_response(status)
+        if tag is not None:
+            self.send_header("ETag", tag)
+            # Clients may keep the response but must check it is current
+            self.send_header("Cache-Control", "no-cache")
+        if body is not None:
+            data = body.encode()
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+        else:
+            self.end_headers()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve the Key Findings tables as JSON.")
+    parser.add_argument("--host", default=DEFAULT_HOST, help="address to listen on")
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT, help="port to listen on")
+    args = parser.parse_args()
+
+    server = http.server.ThreadingHTTPServer((args.host, args.port), Handler)
+    print(f"Serving the Key Findings tables on http://{args.host}:{args.port}/api/tables")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    server.server_close()
+
+
+if __name__ == "__main__":
+    main()
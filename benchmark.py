@@ -0,0 +1,206 @@
+"""
+Benchmarks for the listings pipeline on synthetic data.
+
+    python benchmark.py [--sizes N ...] [--save FILE] [--compare FILE] [--tolerance T]
+
+Generates listings with the schema of pillow_final.csv at each size (by
+default 25k, 250k, 2.5M and 25M rows), writes them to a temporary CSV and
+times every stage the app goes through: parsing and typing the CSV, the
+Parquet cache, the price_range cut and derived columns, each aggregate
+section (in memory, and all of them streamed chunk by chunk), the filter
+index, the leaderboard and serialising the charts.
+
+--save writes the timings to a JSON baseline. --compare checks a run against
+such a baseline and exits with status 1 when a stage is slower by more than
+the tolerance (and by more than NOISE_SECONDS), so regressions show up before
+a deploy.
+"""
+
+import argparse
+import json
+import os
+import platform
+import sys
+import tempfile
+import time
+
+import altair as alt
+import numpy as np
+import pandas as pd
+import plotly.express as px
+
+import aggregates
+import data_loader
+import filters
+import leaderboard
+import streaming
+import tables
+import timeseries
+
+SIZES = [25_000, 250_000, 2_500_000, 25_000_000]
+
+# Rows generated and written per chunk, so 25M rows never sit in memory as strings
+GENERATE_CHUNK = 1_000_000
+
+# Slowdowns below this many seconds are treated as noise
+NOISE_SECONDS = 0.01
+
+# Borough -> (share of listings, number of neighbourhoods, latitude, longitude)
+BOROUGHS = {
+    "Manhattan": (0.41, 32, 40.78, -73.97),
+    "Brooklyn": (0.41, 48, 40.65, -73.95),
+    "Queens": (0.14, 51, 40.73, -73.82),
+    "Bronx": (0.03, 48, 40.84, -73.87),
+    "Staten Island": (0.01, 43, 40.58, -74.15),
+}
+ROOM_TYPES = {"entire home/apt": 0.52, "private room": 0.45, "shared room": 0.03}
+FIRST_REVIEW = pd.Timestamp("2018-07-01")
+REVIEW_DAYS = 370
+
+
+def synthetic_listings(rows, seed=0, start=0):
+    """A frame of rows listings with the columns of pillow_final.csv, numbered from the start-th listing."""
+    rng = np.random.default_rng(seed)
+    names = np.array(list(BOROUGHS))
+    shares, neighbourhoods, latitudes, longitudes = (np.array(v) for v in zip(*BOROUGHS.values()))
+    borough = rng.choice(len(names), rows, p=shares / shares.sum())
+    neighbourhood = rng.integers(0, neighbourhoods[borough])
+    price = np.round(rng.lognormal(4.7, 0.6, rows)).clip(10, 7500)
+    availability = rng.integers(0, 365, rows)
+
+    return pd.DataFrame({
+        "listing_id": (start + np.arange(rows, dtype=np.int64)) * 7 + 2595,
+        "price": price,
+        "borough": names[borough],
+        "neighbourhood": np.char.add(np.char.add(names[borough], " "), neighbourhood.astype(str)),
+        "description": np.array(["Cozy room", "Sunny loft", "Quiet studio", "Large apartment"])[rng.integers(0, 4, rows)],
+        "room_type": rng.choice(list(ROOM_TYPES), rows, p=list(ROOM_TYPES.values())),
+        "host_name": np.array(["Anna", "Ben", "Carla", "David", "Emma"])[rng.integers(0, 5, rows)],
+        "last_review": (FIRST_REVIEW + pd.to_timedelta(rng.integers(0, REVIEW_DAYS, rows), unit="D")).strftime("%Y-%m-%d %H:%M:%S"),
+        "minimum_nights": rng.integers(1, 30, rows),
+        "number_of_reviews": rng.integers(0, 400, rows),
+        "reviews_per_month": np.round(rng.random(rows) * 5, 2),
+        "availability_365": availability,
+        "latitude": latitudes[borough] + rng.normal(0, 0.03, rows),
+        "longitude": longitudes[borough] + rng.normal(0, 0.03, rows),
+        "booked_days_365": 365 - availability,
+    })
+
+
+def write_synthetic_csv(path, rows):
+    for chunk, start in enumerate(range(0, rows, GENERATE_CHUNK)):
+        frame = synthetic_listings(min(GENERATE_CHUNK, rows - start), seed=chunk, start=start)
+        frame.to_csv(path, mode="a" if chunk else "w", header=not chunk, index=False)
+
+
+def _serialise_charts(aggs):
+    counts = aggs["room_types_counts"]
+    px.bar(counts, x="room_type", y="total_listings", template="seaborn").to_json()
+    pie = aggs["pie_data_listings"]
+    px.pie(pie, values="listing_id", names="borough", hole=0.5).to_json()
+    daily, _ = timeseries.series(aggs[timeseries.rollup_name("room_type")], "Day")
+    alt.Chart(daily).mark_line().encode(x="last_review:T", y="booked_days_365:Q", color="room_type").to_dict()
+    with alt.data_transformers.disable_max_rows():
+        alt.Chart(aggs["scatter_sample"]).mark_circle().encode(x="booked_days_365", y="price", color="borough").to_dict()
+
+
+def run_size(rows, workdir):
+    """Seconds per stage for one dataset size."""
+    timings = {}
+
+    def timed(stage, function, *args):
+        start = time.perf_counter()
+        value = function(*args)
+        timings[stage] = time.perf_counter() - start
+        return value
+
+    csv_path = os.path.join(workdir, f"listings_{rows}.csv")
+    cache_path = os.path.join(workdir, f"listings_{rows}.parquet")
+    timed("generate_csv", write_synthetic_csv, csv_path, rows)
+
+    data = timed("load_csv", data_loader.read_listings_csv, csv_path)
+    # The comparables index and the API look listings up by ID
+    assert data["listing_id"].is_unique, "synthetic listing IDs repeat"
+    timed("write_parquet_cache", data_loader.write_listings_cache, data, cache_path, "benchmark")
+    data = timed("read_parquet_cache", data_loader.read_listings_cache, cache_path, "benchmark")
+    timed("price_range_cut", lambda: pd.cut(data["price"], bins=data_loader.PRICE_BINS, labels=data_loader.PRICE_LABELS))
+    timed("derived_columns", data_loader.add_derived_columns, data)
+
+    aggs = {}
+    for name, (builder, _) in aggregates.SECTIONS.items():
+        aggs.update(timed(f"aggregate:{name}", builder, data))
+    timed("derive_from_state", aggregates.derive_from_state, aggs["state_cube"], aggs["state_daily"])
+    timed("streaming_aggregates", streaming.build_aggregates, csv_path)
+
+    index = timed("filter_index", filters.FilterIndex, data)
+    timed("filter_select", index.select, {"borough": ["Queens", "Bronx"], "room_type": ["private room"]})
+    board = leaderboard.Leaderboard(aggs["neighbourhood_leaderboard"])
+    timed("leaderboard_top", board.top, "annual_revenue", 10, None)
+
+    daily, _ = timeseries.series(aggs[timeseries.rollup_name("room_type")], "Day")
+    timed("gradient_table_page", tables.gradient_css, daily.head(tables.PAGE_SIZE), tables.numeric_ranges(daily))
+    timed("serialise_charts", _serialise_charts, aggs)
+
+    os.remove(csv_path)
+    os.remove(cache_path)
+    return timings
+
+
+def environment():
+    return {
+        "python": platform.python_version(),
+        "pandas": pd.__version__,
+        "numpy": np.__version__,
+        "machine": platform.machine(),
+        "cpus": os.cpu_count(),
+    }
+
+
+def compare(results, baseline, tolerance):
+    """(rows, stage, baseline seconds, seconds) for every stage slower than the baseline allows."""
+    regressions = []
+    for rows, timings in results.items():
+        for stage, seconds in timings.items():
+            before = baseline.get(rows, {}).get(stage)
+            if before is None:
+                continue
+            if seconds > before * (1 + tolerance) and seconds - before > NOISE_SECONDS:
+                regressions.append((rows, stage, before, seconds))
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--sizes", type=int, nargs="+", default=SIZES, help="numbers of listings to benchmark")
+    parser.add_argument("--save", help="write the timings to this JSON baseline")
+    parser.add_argument("--compare", help="JSON baseline to check the timings against")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="allowed slowdown, 0.25 is 25%%")
+    args = parser.parse_args()
+
+    results = {}
+    with tempfile.TemporaryDirectory() as workdir:
+        for rows in args.sizes:
+            timings = run_size(rows, workdir)
+            results[str(rows)] = timings
+            print(f"{rows:,} listings")
+            for stage, seconds in timings.items():
+                print(f"  {stage:<28}{seconds:10.4f}s")
+
+    if args.save:
+        with open(args.save, "w") as f:
+            json.dump({"environment": environment(), "results": results}, f, indent=2)
+        print(f"Saved the timings to {args.save}")
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        regressions = compare(results, baseline["results"], args.tolerance)
+        for rows, stage, before, seconds in regressions:
+            print(f"Regression at {int(rows):,} listings: {stage} took {seconds:.4f}s, baseline {before:.4f}s")
+        if regressions:
+            sys.exit(1)
+        print(f"No stage slower than the baseline by more than {args.tolerance:.0%}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,123 @@
+"""
+The Key Findings charts, built from the aggregate tables.
+
+short_rental.py draws these through the figures cache and export.py renders
+them into the static report, so both show the same charts. Plotly Express and
+Altair are imported inside each function to keep them off the app's startup
+path (see import_budget.py).
+"""
+
+import leaderboard
+
+# Value labels of the Top 10 Neighbourhoods chart per leaderboard.METRICS label
+TOP_NEIGHBOURHOODS_FORMATS = {
+    "Revenue": "${:,.0f}",
+    "Average Price": "${:,.2f}",
+    "Listings": "{:,.0f} Listings",
+    "Average Booked Days": "{:,.0f} Days",
+}
+
+# Colours of the price ranges in the over-time charts, Budget to Extravagant
+PRICE_RANGE_COLORS = ["red", "gold", "blue", "orange"]
+
+# Titles of the over-time charts per dimension, filled in with the granularity
+OVER_TIME_TITLES = {
+    "room_type": "Total Booked Days By Room Type Over Time (by {})",
+    "price_range": "Price Range By Total Booked Days (by {})",
+}
+
+
+def _bar(table, x, y, text_format, **kwargs):
+    import plotly.express as px
+    return px.bar(table, x=x, y=y, text=[text_format.format(v) for v in table[y]], template="seaborn", **kwargs)
+
+
+def room_types_counts(table):
+    return _bar(table, "room_type", "total_listings", "{:,.0f}", title="Total Listings By Room Type")
+
+
+def room_types_avg_price(table):
+    return _bar(table, "room_type", "avg_price", "${:,.2f}", title="Average Price By Room Type")
+
+
+def _donut(table, values, title):
+    import plotly.express as px
+    fig = px.pie(table, values=values, names="borough", hole=0.5, title=title)
+    fig.update_traces(text=table["borough"], textposition="outside")
+    return fig
+
+
+def listings_by_borough(table):
+    return _donut(table, "listing_id", "% of Listings by Borough")
+
+
+def revenue_by_borough(table):
+    return _donut(table, "annual_revenue", "% of Annual Revenue by Borough")
+
+
+def top_neighbourhoods(table, rank_by):
+    # Plot the metric the neighbourhoods are ranked by
+    metric = leaderboard.METRICS[rank_by]
+    return _bar(table, "neighbourhood", metric, TOP_NEIGHBOURHOODS_FORMATS[rank_by], labels={metric: rank_by},
+                title=f"Top 10 Neighbourhoods by {rank_by}")
+
+
+def price_ranges_by_listing_count(table):
+    return _bar(table, "price_range", "total_listings", "{:,.0f}Listings", title="Total Listings By Price Range")
+
+
+def price_ranges_by_price(table):
+    return _bar(table, "price_range", "total_booked_days", "{:,.0f}Days", title="Avg Booked Days By Price Range")
+
+
+def reviews_by_borough(table):
+    # Labels follow the unfiltered table, as they always have
+    import plotly.express as px
+    return px.bar(table.dropna(), y="price_range", x="total_reviews",
+                  text=["{:,.0f}".format(v) for v in table["total_reviews"]], template="seaborn", color="borough")
+
+
+def borough_reviews(table):
+    import plotly.express as px
+    return px.bar(table.dropna(), x="price_range", y="number_of_reviews",
+                  text=["{:,.0f}".format(v) for v in table["number_of_reviews"]], template="seaborn")
+
+
+def scatter_bins(table):
+    import altair as alt
+    return alt.Chart(table).mark_circle(opacity=0.6).encode(
+        x="booked_days_365",
+        y="price",
+        color="borough",
+        size=alt.Size("count", title="listings"),
+        tooltip=["borough", "booked_days_365", "price", "count"],
+    ).interactive()
+
+
+def scatter_points(table):
+    import altair as alt
+    return alt.Chart(table).mark_circle(size=20).encode(
+        x="booked_days_365",
+        y="price",
+        color="borough",
+    ).interactive()
+
+
+def _over_time(table, color, title):
+    import altair as alt
+    return alt.Chart(table, height=450).mark_line(strokeWidth=1).encode(
+        x=alt.X("last_review:T", title="last review date"),
+        y=alt.Y("booked_days_365:Q", title="total booked days"),
+        color=color,
+    ).properties(title=title)
+
+
+def room_types_over_time(table, granularity):
+    import altair as alt
+    return _over_time(table, alt.Color("room_type"), OVER_TIME_TITLES["room_type"].format(granularity.lower()))
+
+
+def price_ranges_over_time(table, granularity):
+    import altair as alt
+    return _over_time(table, alt.Color("price_range", scale={"range": PRICE_RANGE_COLORS}),
+                      OVER_TIME_TITLES["price_range"].format(granularity.lower()))
@@ -0,0 +1,216 @@
+"""
+Comparable listings: nearest-neighbour and radius queries on locations.
+
+A SpatialIndex is built once per dataset version. Coordinates are projected to
+metres on a plane tangent at the listings' mean latitude (under 0.5%
+distance error across New York City), and the listings are sorted into square
+cells of CELL_METRES. Each cell's listings are then a contiguous slice, found
+through a dense table of cell offsets, so a query only measures the distance
+to the listings in the few cells around it instead of scanning every listing.
+Many points are queried together, their cells and distances as whole arrays.
+"""
+
+import threading
+
+import numpy as np
+
+import data_loader
+import sql_backend
+
+# Side of a grid cell, about the radius of a typical comparables search
+CELL_METRES = 250
+
+# Candidate listings measured at once when querying many points, bounding memory
+MAX_CANDIDATES = 1_000_000
+
+# Mean Earth radius in metres, in metres per degree
+METRES_PER_DEGREE = 6_371_000 * np.pi / 180
+
+# What a comparable listing shows
+COLUMNS = ["listing_id", "latitude", "longitude", "price", "room_type", "booked_days_365"]
+
+_indexes = {}
+_lock = threading.Lock()
+
+
+class SpatialIndex:
+    """Grid index over the listings with coordinates, for k-nearest and within-radius lookups."""
+
+    def __init__(self, data, cell_metres=CELL_METRES):
+        data = data[COLUMNS].dropna(subset=["latitude", "longitude"])
+        self.cell = cell_metres
+        self.lat0 = data["latitude"].mean()
+        self.lon0 = data["longitude"].mean()
+        self.cos_lat0 = np.cos(np.radians(self.lat0))
+
+        x, y = self.project(data["latitude"].to_numpy(), data["longitude"].to_numpy())
+        ix, iy = np.floor(x / self.cell).astype(np.int64), np.floor(y / self.cell).astype(np.int64)
+        self.ix0, self.iy0 = ix.min(), iy.min()
+        self.nx, self.ny = ix.max() - self.ix0 + 1, iy.max() - self.iy0 + 1
+
+        # Listings sorted by cell, column-major, so a column's run of cells is one slice
+        cells = (ix - self.ix0) * self.ny + (iy - self.iy0)
+        order = np.argsort(cells, kind="stable")
+        self.starts = np.concatenate([[0], np.cumsum(np.bincount(cells, minlength=self.nx * self.ny))])
+        self.x, self.y = x[order], y[order]
+        self.listings = data.iloc[order].reset_index(drop=True)
+        self.prices = self.listings["price"].to_numpy(dtype=np.float64)
+        self._ids = self.listings["listing_id"].to_numpy()
+        self._id_order = np.argsort(self._ids)
+
+    def __len__(self):
+        return len(self.x)
+
+    def project(self, latitude, longitude):
+        latitude = np.asarray(latitude, dtype=np.float64)
+        longitude = np.asarray(longitude, dtype=np.float64)
+        return ((longitude - self.lon0) * self.cos_lat0 * METRES_PER_DEGREE,
+                (latitude - self.lat0) * METRES_PER_DEGREE)
+
+    def position_of(self, listing_id):
+        """Row of listing_id in self.listings, or None."""
+        i = np.searchsorted(self._ids, listing_id, sorter=self._id_order)
+        if i < len(self._ids) and self._ids[self._id_order[i]] == listing_id:
+            return int(self._id_order[i])
+        return None
+
+    def _cells_of(self, xs, ys):
+        return (np.floor(xs / self.cell).astype(np.int64) - self.ix0,
+                np.floor(ys / self.cell).astype(np.int64) - self.iy0)
+
+    def _candidates(self, cx, cy, reach):
+        """
+        The listings within reach cells of each point's cell (cx, cy), in batches of points.
+
+        Yields (points, owners, positions): the indices of some of the points,
+        and for each candidate listing its position and the point in the batch
+        it was found for. Owners come in order, and a point's candidates in
+        grid order. Batches stop at about MAX_CANDIDATES listings.
+        """
+        if not len(cx):
+            return
+        x_low, x_high = np.maximum(cx - reach, 0), np.minimum(cx + reach, self.nx - 1)
+        y_low, y_high = np.maximum(cy - reach, 0), np.minimum(cy + reach, self.ny - 1)
+        columns = np.where(y_low <= y_high, np.maximum(x_high - x_low + 1, 0), 0)
+
+        # One (point, grid column) pair per column searched, whose cells are one slice of listings
+        first_pair = np.cumsum(columns) - columns
+        pair_point = np.repeat(np.arange(len(cx)), columns)
+        pair_column = x_low[pair_point] + np.arange(columns.sum()) - first_pair[pair_point]
+        starts = self.starts[pair_column * self.ny + y_low[pair_point]]
+        lengths = self.starts[pair_column * self.ny + y_high[pair_point] + 1] - starts
+
+        counts = np.bincount(pair_point, weights=lengths, minlength=len(cx))
+        batch = (np.cumsum(counts) - counts) // MAX_CANDIDATES
+        bounds = np.concatenate([[0], np.flatnonzero(np.diff(batch)) + 1, [len(cx)]])
+        for low, high in zip(bounds[:-1], bounds[1:]):
+            pairs = slice(first_pair[low], first_pair[high - 1] + columns[high - 1])
+            batch_starts, batch_lengths = starts[pairs], lengths[pairs]
+            # Concatenated ranges starts[i]:starts[i] + lengths[i] without a Python loop
+            offsets = np.repeat(batch_starts - np.cumsum(np.r_[0, batch_lengths[:-1]]), batch_lengths)
+            yield (np.arange(low, high), np.repeat(pair_point[pairs] - low, batch_lengths),
+                   np.arange(batch_lengths.sum()) + offsets)
+
+    def _distances(self, xs, ys, positions):
+        return np.hypot(self.x[positions] - xs, self.y[positions] - ys)
+
+    def nearest(self, latitudes, longitudes, k=10):
+        """
+        The k listings nearest to each point.
+
+        Returns (positions, distances) arrays of shape (points, k), nearest
+        first, with positions into self.listings and distances in metres.
+        Missing neighbours (fewer than k listings) are -1 and inf.
+        """
+        xs, ys = self.project(np.atleast_1d(latitudes), np.atleast_1d(longitudes))
+        positions = np.full((len(xs), k), -1, dtype=np.int64)
+        distances = np.full((len(xs), k), np.inf)
+        cx, cy = self._cells_of(xs, ys)
+        # Searching this far covers every cell of the grid
+        full_reach = np.maximum.reduce([cx, self.nx - 1 - cx, cy, self.ny - 1 - cy])
+
+        # Points whose k nearest are not settled yet, searched further each round
+        pending, reach = np.arange(len(xs)), 1
+        while len(pending):
+            unsettled = []
+            for batch, owners, found in self._candidates(cx[pending], cy[pending], reach):
+                points = pending[batch]
+                metres = self._distances(xs[points][owners], ys[points][owners], found)
+                # By point, then distance, ties in grid order
+                order = np.lexsort((metres, owners))
+                owners, found, metres = owners[order], found[order], metres[order]
+                counts = np.bincount(owners, minlength=len(points))
+                rank = np.arange(len(owners)) - np.repeat(np.cumsum(counts) - counts, counts)
+
+                # Every listing closer than reach cells lies in the searched cells
+                kth = np.full(len(points), np.inf)
+                kth[owners[rank == k - 1]] = metres[rank == k - 1]
+                settled = (kth <= reach * self.cell) | (reach >= full_reach[points])
+                keep = settled[owners] & (rank < k)
+                positions[points[owners[keep]], rank[keep]] = found[keep]
+                distances[points[owners[keep]], rank[keep]] = metres[keep]
+                unsettled.append(points[~settled])
+            pending = np.concatenate(unsettled)
+            reach *= 2
+        return positions, distances
+
+    def within(self, latitudes, longitudes, radius):
+        """For each point, the positions of the listings within radius metres."""
+        found = [None] * len(np.atleast_1d(latitudes))
+        for points, owners, positions in self._within(latitudes, longitudes, radius):
+            for point, group in zip(points, np.split(positions, np.searchsorted(owners, np.arange(1, len(points))))):
+                found[point] = group
+        return found
+
+    def _within(self, latitudes, longitudes, radius):
+        """_candidates batches cut down to the listings within radius metres."""
+        xs, ys = self.project(np.atleast_1d(latitudes), np.atleast_1d(longitudes))
+        cx, cy = self._cells_of(xs, ys)
+        reach = int(np.ceil(radius / self.cell))
+        for points, owners, positions in self._candidates(cx, cy, reach):
+            close = self._distances(xs[points][owners], ys[points][owners], positions) <= radius
+            yield points, owners[close], positions[close]
+
+    def median_price(self, latitudes, longitudes, radius):
+        """(median price, number of priced listings) within radius metres of each point."""
+        medians = np.full(len(np.atleast_1d(latitudes)), np.nan)
+        counts = np.zeros(len(medians), dtype=np.int64)
+        for points, owners, positions in self._within(latitudes, longitudes, radius):
+            prices = self.prices[positions]
+            priced = ~np.isnan(prices)
+            owners, prices = owners[priced], prices[priced]
+            # Prices sorted within each point, the median is the middle one or two
+            order = np.lexsort((prices, owners))
+            owners, prices = owners[order], prices[order]
+            n = np.bincount(owners, minlength=len(points))
+            first = np.cumsum(n) - n
+            some = n > 0
+            low, high = (first + (n - 1) // 2)[some], (first + n // 2)[some]
+            medians[points[some]] = (prices[low] + prices[high]) / 2
+            counts[points] = n
+        return medians, counts
+
+    def comparables(self, listing_id, k=10):
+        """The k listings nearest to listing_id, leaving it out, with their distance in metres."""
+        position = self.position_of(listing_id)
+        if position is None:
+            raise KeyError(listing_id)
+        listing = self.listings.iloc[position]
+        positions, distances = self.nearest(listing["latitude"], listing["longitude"], k + 1)
+        keep = (positions[0] != position) & (positions[0] >= 0)
+        positions, distances = positions[0][keep][:k], distances[0][keep][:k]
+        return self.listings.iloc[positions].assign(distance_m=np.round(distances)).reset_index(drop=True)
+
+
+def load_index():
+    """The spatial index for the current listings file, shared by every session."""
+    version = data_loader.dataset_version()
+    with _lock:
+        if version not in _indexes:
+            _indexes.clear()
+            if sql_backend.enabled():
+                data = sql_backend.columns(COLUMNS)
+            else:
+                data = data_loader.load_listings()
+            _indexes[version] = SpatialIndex(data)
+        return _indexes[version]
@@ -0,0 +1,404 @@
+"""
+Cached loaders for the files in Data/.
+
+Streamlit reruns short_rental.py on every widget interaction, so every file read
+goes through a process-wide cache keyed on the file path, its modification time
+and its size. All sessions share one parsed copy, and a file that changes on
+disk is parsed again on the next rerun.
+
+The listings CSV is converted once into a typed Parquet file next to it
+(pillow_final.parquet) and read from there until the CSV changes: categoricals
+for the borough, neighbourhood and room type, a datetime for last_review,
+compact integers for the counts and no leftover index columns.
+
+Refreshes never rewrite the listings file. Each one appends its changed rows
+as one more Parquet part under pillow_final.changes/, and the parts are merged
+over the CSV on load: the last change to a listing_id replaces its row or,
+for a "delete" change, removes it. The dataset version moves on with every
+part. write_listings folds the change log back into the CSV.
+
+Frames handed out by this module are shared between sessions and must not be
+modified in place.
+"""
+
+import hashlib
+import os
+import shutil
+import tempfile
+import threading
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+DATA_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "Data")
+
+LISTINGS_FILE = "pillow_final.csv"
+LISTINGS_CACHE_FILE = "pillow_final.parquet"
+LISTINGS_CHANGES_DIR = "pillow_final.changes"
+PRICES_FILE = "prices.csv"
+ROOM_TYPES_FILE = "room_types.xlsx"
+REVIEWS_FILE = "reviews.tsv"
+
+# Labels and bins for the price_range column
+PRICE_LABELS = ["Budget", "Average", "Expensive", "Extravagant"]
+PRICE_BINS = [0, 69, 175, 350, np.inf]
+
+# Column types for the listings dataset
+CATEGORY_COLUMNS = ["borough", "neighbourhood", "room_type"]
+STRING_COLUMNS = ["description", "host_name"]
+INTEGER_COLUMNS = ["listing_id", "minimum_nights", "number_of_reviews",
+                   "availability_365", "booked_days_365"]
+
+_SOURCE_VERSION_KEY = b"rental.source_version"
+
+# Read Arrow strings straight into string[pyarrow] columns, without a detour through Python objects
+_ARROW_TYPES = {pa.string(): pd.StringDtype("pyarrow")}
+
+_cache = {}
+_path_locks = {}
+_lock = threading.Lock()
+
+
+def data_path(file_name):
+    return os.path.join(DATA_DIR, file_name)
+
+
+def file_key(path):
+    """Return (path, mtime, size) for a file, used as its cache key."""
+    stat = os.stat(path)
+    return (os.path.abspath(path), stat.st_mtime_ns, stat.st_size)
+
+
+def path_version(path):
+    """Short id that changes whenever the file changes on disk."""
+    _, mtime, size = file_key(path)
+    name = os.path.basename(path)
+    return hashlib.sha1(f"{name}:{mtime}:{size}".encode()).hexdigest()[:12]
+
+
+def listings_version(path):
+    """path_version of a listings file, moved on by every part of its change log."""
+    version = path_version(path)
+    parts = change_parts(path)
+    if parts:
+        names = ":".join(os.path.basename(part) for part in parts)
+        version = hashlib.sha1(f"{version}:{names}".encode()).hexdigest()[:12]
+    return version
+
+
+def dataset_version(file_name=LISTINGS_FILE):
+    if file_name == LISTINGS_FILE:
+        return listings_version(data_path(file_name))
+    return path_version(data_path(file_name))
+
+
+def cached_read(path, reader, depends_on=()):
+    """
+    Return reader(path), parsing the file only when it, or one of the files in
+    depends_on, is new or has changed.
+
+    Concurrent sessions asking for the same file wait for a single parse
+    instead of each starting their own.
+    """
+    key = (file_key(path),) + tuple(file_key(other) for other in depends_on)
+    with _lock:
+        path_lock = _path_locks.setdefault(key[0][0], threading.Lock())
+
+    with path_lock:
+        entry = _cache.get((key[0][0], reader))
+        if entry is not None and entry[0] == key:
+            return entry[1]
+        value = reader(path)
+        _cache[(key[0][0], reader)] = (key, value)
+        return value
+
+
+def clear_cache():
+    with _lock:
+        _cache.clear()
+
+
+def _to_arrow_strings(df):
+    for column in STRING_COLUMNS:
+        if column in df:
+            df[column] = df[column].astype("string[pyarrow]")
+
+
+def read_listings_csv(path):
+    """Parse the listings CSV into the typed schema."""
+    # Skip the index columns left behind by earlier exports
+    df = pd.read_csv(path,
+                     usecols=lambda c: not c.startswith("Unnamed: 0"),
+                     dtype={c: "category" for c in CATEGORY_COLUMNS})
+    return apply_schema(df)
+
+
+def read_listings_chunks(path, chunksize, columns=None):
+    """
+    Parse the listings CSV chunksize rows at a time, with its change log applied.
+
+    Each chunk is typed and has the derived columns, or just columns when
+    given. The changed listings come last, in a chunk of their own.
+    """
+    changes = read_changes(path)
+    if columns is None:
+        usecols = lambda c: not c.startswith("Unnamed: 0")
+    else:
+        usecols = lambda c: c in columns or c == "listing_id"
+
+    def typed(chunk):
+        chunk = apply_schema(chunk)
+        if columns is not None:
+            return chunk[columns]
+        add_derived_columns(chunk)
+        return chunk
+
+    for chunk in pd.read_csv(path, chunksize=chunksize, usecols=usecols):
+        if changes is not None:
+            chunk = chunk[~chunk["listing_id"].isin(changes["listing_id"])].copy()
+        if len(chunk):
+            yield typed(chunk)
+    if changes is not None:
+        added = changed_rows(changes)
+        if len(added):
+            yield typed(added)
+
+
+def apply_schema(df):
+    """Convert the listings columns of df to their typed representation."""
+    for column in CATEGORY_COLUMNS:
+        if column in df and not isinstance(df[column].dtype, pd.CategoricalDtype):
+            df[column] = df[column].astype("category")
+
+    _to_arrow_strings(df)
+
+    for column in INTEGER_COLUMNS:
+        if column in df and not df[column].isna().any():
+            df[column] = pd.to_numeric(df[column], downcast="integer")
+
+    # Timestamps are exported as "2019-05-21 00:00:00", only the day matters
+    if "last_review" in df:
+        df["last_review"] = pd.to_datetime(df["last_review"]).dt.normalize()
+    return df
+
+
+def concat_listings(frames):
+    """pd.concat of listings frames that keeps the category columns categorical."""
+    frames = [frame.copy(deep=False) for frame in frames]
+    for column in CATEGORY_COLUMNS:
+        if all(column in frame for frame in frames):
+            values = set()
+            for frame in frames:
+                values.update(frame[column].cat.categories)
+            categories = sorted(values)
+            for frame in frames:
+                frame[column] = frame[column].cat.set_categories(categories)
+    return pd.concat(frames, ignore_index=True)
+
+
+def write_listings_cache(df, cache_path, source_version):
+    table = pa.Table.from_pandas(df, preserve_index=False)
+    metadata = dict(table.schema.metadata or {})
+    metadata[_SOURCE_VERSION_KEY] = source_version.encode()
+    table = table.replace_schema_metadata(metadata)
+
+    # A temporary file of its own, so concurrent writers never share one
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(cache_path), prefix=".tmp-", suffix=".parquet")
+    os.close(fd)
+    try:
+        pq.write_table(table, tmp_path)
+        os.replace(tmp_path, cache_path)
+    except BaseException:
+        os.remove(tmp_path)
+        raise
+
+
+def is_current_cache(cache_path, source_version):
+    if not os.path.exists(cache_path):
+        return False
+    metadata = pq.read_schema(cache_path).metadata or {}
+    return metadata.get(_SOURCE_VERSION_KEY) == source_version.encode()
+
+
+def read_listings_cache(cache_path, source_version, filters=None):
+    """Return the cached frame, or None if it is missing or was built from another CSV."""
+    if not is_current_cache(cache_path, source_version):
+        return None
+    return pq.read_table(cache_path, filters=filters).to_pandas(types_mapper=_ARROW_TYPES.get)
+
+
+def change_parts(path):
+    """The Parquet parts of the change log of a listings file, oldest first."""
+    directory = changes_dir(path)
+    if not os.path.isdir(directory):
+        return []
+    names = sorted(name for name in os.listdir(directory) if name.endswith(".parquet") and not name.startswith("."))
+    return [os.path.join(directory, name) for name in names]
+
+
+def changes_dir(path):
+    return os.path.join(os.path.dirname(path), LISTINGS_CHANGES_DIR)
+
+
+def read_changes(path):
+    """The last change to every listing in the change log of a listings file, or None without one."""
+    parts = change_parts(path)
+    if not parts:
+        return None
+    changes = pd.concat([pq.read_table(part).to_pandas() for part in parts], ignore_index=True)
+    return changes.drop_duplicates("listing_id", keep="last").reset_index(drop=True)
+
+
+def changed_rows(changes):
+    """The listings the changes add or replace, in the typed schema."""
+    added = changes[changes["change"] != "delete"].drop(columns="change").reset_index(drop=True)
+    return apply_schema(added)
+
+
+def apply_changes(df, changes):
+    """df with the changed listings replaced, or removed for "delete" changes."""
+    if changes is None:
+        return df
+    kept = df[~df["listing_id"].isin(changes["listing_id"])]
+    return concat_listings([kept, changed_rows(changes)])
+
+
+def append_changes(changes, path=None):
+    """
+    Add changes (the listings columns plus "change") to the change log as a
+    new part and return the new dataset version.
+
+    The part is the only file written, so a refresh costs as much as its
+    changes whatever the size of the dataset.
+    """
+    path = path or data_path(LISTINGS_FILE)
+    directory = changes_dir(path)
+    os.makedirs(directory, exist_ok=True)
+
+    parts = change_parts(path)
+    number = int(os.path.basename(parts[-1]).split(".")[0]) + 1 if parts else 1
+    changes = apply_schema(changes.drop(columns=[c for c in DERIVED_COLUMNS if c in changes]))
+    table = pa.Table.from_pandas(changes, preserve_index=False)
+
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=".tmp-", suffix=".parquet")
+    os.close(fd)
+    try:
+        pq.write_table(table, tmp_path)
+        os.replace(tmp_path, os.path.join(directory, f"{number:06d}.parquet"))
+    except BaseException:
+        os.remove(tmp_path)
+        raise
+    return listings_version(path)
+
+
+def _base_listings(path):
+    cache_path = os.path.join(os.path.dirname(path), LISTINGS_CACHE_FILE)
+    source_version = path_version(path)
+
+    df = read_listings_cache(cache_path, source_version)
+    if df is None:
+        df = read_listings_csv(path)
+        try:
+            write_listings_cache(df, cache_path, source_version)
+        except OSError:
+            # Read-only deploys fall back to parsing the CSV once per process
+            pass
+    return df
+
+
+def _read_listings(path):
+    df = apply_changes(_base_listings(path), read_changes(path))
+
+    # Derived columns are computed once here and shared by every session
+    add_derived_columns(df)
+    return df
+
+
+def read_listing_rows(listing_ids, path=None):
+    """
+    The current rows of the given listings, with the derived columns.
+
+    Only those rows are read: from the change log, or from the Parquet cache
+    with a listing_id filter, so the cost follows the number of listings
+    asked for rather than the size of the dataset.
+    """
+    path = path or data_path(LISTINGS_FILE)
+    cache_path = os.path.join(os.path.dirname(path), LISTINGS_CACHE_FILE)
+    source_version = path_version(path)
+    if not is_current_cache(cache_path, source_version):
+        write_listings_cache(read_listings_csv(path), cache_path, source_version)
+
+    listing_ids = [int(listing_id) for listing_id in pd.unique(listing_ids)]
+    rows = read_listings_cache(cache_path, source_version, filters=[("listing_id", "in", listing_ids)])
+    rows = apply_changes(rows, read_changes(path))
+    rows = rows[rows["listing_id"].isin(listing_ids)].reset_index(drop=True)
+    add_derived_columns(rows)
+    return rows
+
+
+def add_derived_columns(df):
+    df["price_range"] = pd.cut(df["price"], bins=PRICE_BINS, labels=PRICE_LABELS)
+    df["price_per_month"] = (df["price"] * 365 / 12).astype(np.float32)
+    df["annual_revenue"] = df["price"] * df["booked_days_365"]
+
+
+DERIVED_COLUMNS = ["price_range", "price_per_month", "annual_revenue"]
+
+
+def write_listings(df, path=None):
+    """
+    Replace the listings CSV with df, refresh its Parquet cache and clear
+    the change log, which df is expected to include.
+
+    Derived columns are dropped, they are added again on load. Returns the
+    new dataset version.
+    """
+    path = path or data_path(LISTINGS_FILE)
+    source = apply_schema(df.drop(columns=[c for c in DERIVED_COLUMNS if c in df]))
+
+    tmp_path = path + ".tmp"
+    source.to_csv(tmp_path, index=False, date_format="%Y-%m-%d")
+    os.replace(tmp_path, path)
+
+    source_version = path_version(path)
+    write_listings_cache(source, os.path.join(os.path.dirname(path), LISTINGS_CACHE_FILE), source_version)
+    shutil.rmtree(changes_dir(path), ignore_errors=True)
+    return source_version
+
+
+def _read_prices(path):
+    return pd.read_csv(path, encoding="ISO-8859-1")
+
+
+def _read_room_types(path):
+    return pd.read_excel(path)
+
+
+def _read_reviews(path):
+    return pd.read_csv(path, delimiter="\t", encoding="ISO-8859-1")
+
+
+def load_listings():
+    """
+    The merged listings dataset (pillow_final.csv) with price_range,
+    price_per_month and annual_revenue added.
+
+    This is the single shared copy for the whole process; filter it with
+    boolean masks or groupbys rather than copying or assigning into it.
+    """
+    path = data_path(LISTINGS_FILE)
+    return cached_read(path, _read_listings, change_parts(path))
+
+
+def load_prices():
+    return cached_read(data_path(PRICES_FILE), _read_prices)
+
+
+def load_room_types():
+    return cached_read(data_path(ROOM_TYPES_FILE), _read_room_types)
+
+
+def load_reviews():
+    return cached_read(data_path(REVIEWS_FILE), _read_reviews)
@@ -0,0 +1,113 @@
+"""
+Server-side reduction of point data before it is sent to the browser.
+
+Altair serialises every row of its source frame into the page, so scatter
+plots over the whole listings frame ship tens of thousands of points. These
+helpers reduce a frame to a bounded number of rows first: either 2D bins with
+a count per bin, or a stratified sample with a size cap.
+"""
+
+import numpy as np
+import pandas as pd
+
+
+def bin_edges(low, high, bins, log=False):
+    """bins + 1 edges spanning the values from low to high."""
+    if log:
+        low = max(low, 1)
+        high = max(high, low * 1.0001)
+        return np.geomspace(low, high, bins + 1)
+    high = max(high, low + 1)
+    return np.linspace(low, high, bins + 1)
+
+
+def _bin_index(values, edges):
+    index = np.searchsorted(edges, values, side="right") - 1
+    return np.clip(index, 0, len(edges) - 2)
+
+
+def _valid_pairs(data, x, y):
+    x_values = data[x].to_numpy(dtype=float)
+    y_values = data[y].to_numpy(dtype=float)
+    valid = ~(np.isnan(x_values) | np.isnan(y_values))
+    return x_values[valid], y_values[valid], valid
+
+
+def bin_counts(data, x, y, x_edges, y_edges, color=None):
+    """Number of rows per non-empty (x_bin, y_bin) and color value, for the given edges."""
+    x_values, y_values, valid = _valid_pairs(data, x, y)
+    keys = {"x_bin": _bin_index(x_values, x_edges), "y_bin": _bin_index(y_values, y_edges)}
+    if color is not None:
+        keys[color] = data[color].to_numpy()[valid]
+    return pd.DataFrame(keys).groupby(list(keys), observed=True).size().reset_index(name="count")
+
+
+def label_bins(counts, x, y, x_edges, y_edges, color=None, y_log=False):
+    """The output of bin_2d from bin_counts: bin centres in the x and y columns."""
+    x_centres = (x_edges[:-1] + x_edges[1:]) / 2
+    if y_log:
+        y_centres = np.sqrt(y_edges[:-1] * y_edges[1:])
+    else:
+        y_centres = (y_edges[:-1] + y_edges[1:]) / 2
+    counts[x] = x_centres[counts["x_bin"]]
+    counts[y] = y_centres[counts["y_bin"]]
+    columns = [x, y] + ([color] if color is not None else []) + ["count"]
+    return counts[columns]
+
+
+def bin_2d(data, x, y, color=None, x_bins=37, y_bins=40, y_log=False):
+    """
+    Count the rows of data in a grid of x_bins by y_bins rectangles.
+
+    Returns one row per non-empty bin (and per color value, if given) with the
+    bin centre in the x and y columns and the number of rows in "count". With
+    y_log the y bins are spaced geometrically, which keeps detail at low prices
+    when a few listings reach into the thousands.
+    """
+    x_values, y_values, _ = _valid_pairs(data, x, y)
+    x_edges = bin_edges(np.nanmin(x_values), np.nanmax(x_values), x_bins)
+    y_edges = bin_edges(np.nanmin(y_values), np.nanmax(y_values), y_bins, log=y_log)
+    counts = bin_counts(data, x, y, x_edges, y_edges, color)
+    return label_bins(counts, x, y, x_edges, y_edges, color, y_log)
+
+
+def stratified_sample(data, by, cap, min_per_group=50, seed=0):
+    """
+    Sample at most cap rows, keeping every group of the by column represented.
+
+    Groups are sampled in proportion to their size, but small groups get at
+    least min_per_group rows (or all of their rows) so they stay visible.
+    When those minimums would take the sample over cap, they shrink to an
+    even share of it and the larger groups give up the rest in proportion.
+    """
+    if len(data) <= cap:
+        return data
+
+    sizes = data.groupby(by, observed=True).size()
+    codes = data[by].to_numpy()
+    picked = [np.flatnonzero(codes == value)[ordinals]
+              for value, ordinals in stratified_picks(sizes, len(data), cap, min_per_group, seed).items()]
+    return data.iloc[np.sort(np.concatenate(picked))]
+
+
+def stratified_picks(sizes, rows, cap, min_per_group=50, seed=0):
+    """
+    Which rows of each group stratified_sample keeps.
+
+    sizes is the number of rows per group, in group order, out of rows in
+    total. Returns the ordinals of the kept rows within each group, so the
+    sample can also be drawn while streaming over the rows.
+    """
+    counts = sizes.to_numpy()
+    quota = np.maximum(np.floor(counts * cap / rows), np.minimum(counts, min_per_group)).astype(int)
+    if quota.sum() > cap:
+        # Many small groups: guarantee each an even share of cap, scale the surplus to fit
+        minimum = np.minimum(quota, cap // len(quota))
+        share = (quota - minimum) * (cap - minimum.sum()) / (quota - minimum).sum()
+        quota = minimum + np.floor(share).astype(int)
+        # Rows lost to rounding go to the largest remainders
+        remainders = np.argsort(np.floor(share) - share, kind="stable")
+        quota[remainders[:cap - quota.sum()]] += 1
+    rng = np.random.default_rng(seed)
+    return {value: rng.choice(size, size=min(n, size), replace=False)
+            for (value, size), n in zip(sizes.items(), quota)}
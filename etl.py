@@ -0,0 +1,165 @@
+"""
+Rebuild the merged listings dataset from the three source files.
+
+    python etl.py [output] [--extras FILE] [--chunksize N]
+
+prices.csv is streamed in chunks. Each chunk has its "225 dollars" prices
+parsed, nbhood_full split into borough and neighbourhood, zero prices dropped,
+and is joined on listing_id against hash indexes built once from
+room_types.xlsx and reviews.tsv. Every joined chunk is appended to the output
+straight away (a Parquet row group, or CSV rows when the output ends in .csv),
+so memory stays bounded by the chunk size and the lookups.
+
+With --parallel the sources are parsed across worker processes by ingest.py
+instead, which is faster on a multi-core machine but holds all the prices in
+memory at once.
+
+The three sources only cover the Part 1 columns. The Part 2 columns of
+pillow_final.csv (minimum_nights, number_of_reviews, reviews_per_month,
+availability_365, booked_days_365, latitude, longitude) come from a separate
+scrape; pass that file with --extras to join it in as well.
+"""
+
+import argparse
+import os
+import time
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+import data_loader
+import ingest
+import sources
+
+DEFAULT_OUTPUT = data_loader.data_path("listings_etl.parquet")
+DEFAULT_CHUNKSIZE = 100_000
+
+def hash_join(left, lookup, how="inner"):
+    """Join lookup columns onto left by listing_id through the lookup's hash index."""
+    positions = lookup.index.get_indexer(left["listing_id"])
+    if how == "inner":
+        matched = positions >= 0
+        left, positions = left[matched], positions[matched]
+        right = lookup.iloc[positions]
+    else:
+        right = lookup.reindex(left["listing_id"])
+    return left.assign(**{column: right[column].to_numpy() for column in lookup.columns})
+
+
+def transform(prices_chunk, room_types, reviews, extras=None):
+    return join(sources.parse_prices(prices_chunk), room_types, reviews, extras)
+
+
+def join(prices, room_types, reviews, extras=None):
+    """Join parsed prices with the lookups and type the result."""
+    listings = hash_join(prices, room_types)
+    listings = hash_join(listings, reviews)
+    if extras is not None:
+        listings = hash_join(listings, extras, how="left")
+
+    listings = listings.assign(
+        borough=listings["borough"].astype("category"),
+        neighbourhood=listings["neighbourhood"].astype("category"),
+        room_type=listings["room_type"].astype(pd.CategoricalDtype(sources.ROOM_TYPES)),
+        price_range=pd.cut(listings["price"], bins=data_loader.PRICE_BINS, labels=data_loader.PRICE_LABELS),
+    )
+    return listings.reset_index(drop=True)
+
+
+class ListingsWriter:
+    """Append chunks to a Parquet file (one row group each) or a CSV file."""
+
+    def __init__(self, path):
+        self.path = path
+        self.tmp_path = path + ".tmp"
+        self.csv = path.endswith(".csv")
+        self.rows = 0
+        self._writer = None
+        self._schema = None
+
+    def write(self, chunk):
+        if self.csv:
+            chunk.to_csv(self.tmp_path, mode="a" if self.rows else "w", header=not self.rows, index=False)
+        else:
+            table = pa.Table.from_pandas(chunk, preserve_index=False)
+            if self._writer is None:
+                # Categories differ between chunks, so store them with fixed-width indices
+                self._schema = pa.schema([
+                    pa.field(f.name, pa.dictionary(pa.int32(), f.type.value_type))
+                    if pa.types.is_dictionary(f.type) else f
+                    for f in table.schema
+                ], metadata=table.schema.metadata)
+                self._writer = pq.ParquetWriter(self.tmp_path, self._schema)
+            self._writer.write_table(table.cast(self._schema))
+        self.rows += len(chunk)
+
+    def close(self):
+        if self._writer is not None:
+            self._writer.close()
+        if os.path.exists(self.tmp_path):
+            os.replace(self.tmp_path, self.path)
+
+    def abort(self):
+        if self._writer is not None:
+            self._writer.close()
+        if os.path.exists(self.tmp_path):
+            os.remove(self.tmp_path)
+
+
+def read_extras(path):
+    if path.endswith(".parquet"):
+        extras = pd.read_parquet(path)
+    else:
+        extras = pd.read_csv(path, usecols=lambda c: not c.startswith("Unnamed: 0"))
+    extras = extras.set_index("listing_id")
+    # Keep only the Part 2 columns, the rest come from the sources
+    extras = extras[[c for c in extras.columns if c not in
+                     ("price", "nbhood_full", "borough", "neighbourhood", "description",
+                      "room_type", "host_name", "last_review", "price_range", "price_per_month")]]
+    return sources.build_lookup(extras)
+
+
+def run(output=DEFAULT_OUTPUT, extras_path=None, chunksize=DEFAULT_CHUNKSIZE, parallel=False, workers=None):
+    """Run the pipeline and return the number of listings written."""
+    extras = read_extras(extras_path) if extras_path else None
+
+    writer = ListingsWriter(output)
+    try:
+        if parallel:
+            parsed = ingest.read_sources(workers)
+            prices = parsed["prices"]
+            for start in range(0, len(prices), chunksize):
+                writer.write(join(prices.iloc[start:start + chunksize], parsed["room_types"],
+                                  parsed["reviews"], extras))
+        else:
+            room_types = sources.parse_room_types_file(data_loader.data_path(data_loader.ROOM_TYPES_FILE))
+            reviews = sources.parse_reviews_file(data_loader.data_path(data_loader.REVIEWS_FILE))
+            chunks = pd.read_csv(data_loader.data_path(data_loader.PRICES_FILE), chunksize=chunksize,
+                                 **sources.PRICES_READ_ARGS)
+            for chunk in chunks:
+                writer.write(transform(chunk, room_types, reviews, extras))
+    except BaseException:
+        writer.abort()
+        raise
+    writer.close()
+    return writer.rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("output", nargs="?", default=DEFAULT_OUTPUT,
+                        help="Parquet file, or CSV when the name ends in .csv")
+    parser.add_argument("--extras", help="file with the Part 2 columns, joined on listing_id")
+    parser.add_argument("--chunksize", type=int, default=DEFAULT_CHUNKSIZE)
+    parser.add_argument("--parallel", action="store_true", help="parse the sources across worker processes")
+    parser.add_argument("--workers", type=int, help="worker processes for --parallel (default: one per core)")
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    rows = run(args.output, args.extras, args.chunksize, args.parallel, args.workers)
+    print(f"Wrote {rows:,} listings to {args.output} in {time.perf_counter() - start:.2f}s")
+
+
+if __name__ == "__main__":
+    main()
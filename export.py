@@ -0,0 +1,302 @@
+"""
+Static export of the Key Findings report.
+
+    python export.py [--out DIR] [--workers N] [--png] [--force]
+
+Renders every Key Findings chart, with its data table, the price statistics,
+the neighbourhood rankings and the per-borough review tabs, into a single
+self-contained HTML file: DIR/index.html, by default
+Data/report/<dataset version>/. Plotly.js is inlined once and the tabs are a
+few lines of script, so the page opens offline and can be served as a plain
+file with no compute per view.
+
+The charts are independent, so each one is built and serialised in a pool of
+worker processes. The Altair charts of the app are drawn with their Plotly
+equivalents here, since inlining Vega would need the vl-convert package. An
+existing report for the current dataset version is kept unless --force is
+given. --png also writes every chart as DIR/<chart>.png, which needs the
+kaleido package.
+"""
+
+import argparse
+import base64
+import concurrent.futures
+import functools
+import html
+import importlib.util
+import json
+import os
+
+import aggregates
+import charts
+import data_loader
+import leaderboard
+import price_stats
+import tables
+import timeseries
+
+REPORT_DIR = os.path.join(data_loader.DATA_DIR, "report")
+IMAGES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "images")
+
+STYLE = """
+body { font-family: sans-serif; max-width: 1200px; margin: 2rem auto; padding: 0 1rem; color: #262730; }
+.row { display: flex; flex-wrap: wrap; gap: 1rem; }
+.row > div { flex: 1 1 350px; min-width: 0; }
+.tab-buttons button { border: none; background: none; padding: 0.5rem 1rem; cursor: pointer; border-bottom: 2px solid transparent; }
+.tab-buttons button.active { border-bottom-color: #ff4b4b; color: #ff4b4b; }
+.tab-panel { display: none; }
+.tab-panel.active { display: block; }
+details { margin: 0.5rem 0 1.5rem; }
+table { border-collapse: collapse; font-size: 0.85rem; }
+td, th { padding: 0.2rem 0.6rem; text-align: right; }
+"""
+
+SCRIPT = """
+for (const spec of JSON.parse(document.getElementById("chart-specs").textContent)) {
+  Plotly.newPlot(spec.id, spec.figure.data, spec.figure.layout, {responsive: true});
+}
+for (const tabs of document.querySelectorAll(".tabs")) {
+  const buttons = tabs.querySelectorAll(":scope > .tab-buttons > button");
+  const panels = tabs.querySelectorAll(":scope > .tab-panel");
+  buttons.forEach((button, i) => button.addEventListener("click", () => {
+    buttons.forEach((b, j) => b.classList.toggle("active", i === j));
+    panels.forEach((p, j) => p.classList.toggle("active", i === j));
+    panels[i].querySelectorAll(".js-plotly-plot").forEach(plot => Plotly.Plots.resize(plot));
+  }));
+}
+"""
+
+
+# Chart builders, aggregate store -> Plotly figure. Module level, so the
+# worker processes can unpickle them.
+
+def scatter_bins(aggs):
+    import plotly.express as px
+    return px.scatter(aggs["scatter_bins"], x="booked_days_365", y="price", color="borough", size="count",
+                      opacity=0.6, labels={"count": "listings"})
+
+
+def scatter_sample(aggs):
+    import plotly.express as px
+    return px.scatter(aggs["scatter_sample"], x="booked_days_365", y="price", color="borough")
+
+
+def over_time(aggs, dim):
+    import plotly.express as px
+    table, granularity = timeseries.series(aggs[timeseries.rollup_name(dim)])
+    colors = charts.PRICE_RANGE_COLORS if dim == "price_range" else None
+    fig = px.line(table, x="last_review", y="booked_days_365", color=dim, height=450, color_discrete_sequence=colors,
+                  labels={"last_review": "last review date", "booked_days_365": "total booked days"},
+                  title=charts.OVER_TIME_TITLES[dim].format(granularity.lower()))
+    return fig.update_traces(line_width=1)
+
+
+def from_table(aggs, name, chart):
+    return getattr(charts, chart)(aggs[name])
+
+
+def top_neighbourhoods(aggs, rank_by, borough):
+    return charts.top_neighbourhoods(_top_neighbourhoods(aggs, rank_by, borough), rank_by)
+
+
+def borough_reviews(aggs, borough):
+    return charts.borough_reviews(_borough_reviews(aggs, borough))
+
+
+def _top_neighbourhoods(aggs, rank_by, borough):
+    board = leaderboard.Leaderboard(aggs["neighbourhood_leaderboard"])
+    return board.top(leaderboard.METRICS[rank_by], 10, borough)
+
+
+def _borough_reviews(aggs, borough):
+    return aggregates.borough_reviews(aggregates.Cube(aggs["reviews_cube"], ["price_range", "borough"]), borough)
+
+
+def chart_jobs():
+    """Chart id -> builder for every chart in the report."""
+    jobs = {
+        "scatter/Binned": scatter_bins,
+        "scatter/Sample": scatter_sample,
+        "booked_days_by_room_type": functools.partial(over_time, dim="room_type"),
+        "booked_days_by_price_range": functools.partial(over_time, dim="price_range"),
+    }
+    for name, chart in [("room_types_counts", "room_types_counts"), ("room_types_avg_price", "room_types_avg_price"),
+                        ("pie_data_listings", "listings_by_borough"),
+                        ("pie_data_yearly_reveneue", "revenue_by_borough"),
+                        ("price_ranges_by_listing_count", "price_ranges_by_listing_count"),
+                        ("price_ranges_by_price", "price_ranges_by_price"), ("all_boroughs", "reviews_by_borough")]:
+        jobs[name] = functools.partial(from_table, name=name, chart=chart)
+    for rank_by in leaderboard.METRICS:
+        jobs[f"neighbourhoods_top_10/{rank_by}"] = functools.partial(top_neighbourhoods, rank_by=rank_by, borough=None)
+    for borough in aggregates.BOROUGHS:
+        jobs[f"reviews/{borough}"] = functools.partial(borough_reviews, borough=borough)
+    return jobs
+
+
+def render(chart_id, build, png_dir=None):
+    """Build one chart in a worker and return its Plotly JSON."""
+    fig = build(aggregates.load_aggregates())
+    if png_dir is not None:
+        fig.write_image(os.path.join(png_dir, chart_id.replace("/", "_").replace(" ", "_") + ".png"))
+    return fig.to_json()
+
+
+def render_all(jobs, workers, png_dir=None):
+    with concurrent.futures.ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = {chart_id: pool.submit(render, chart_id, build, png_dir) for chart_id, build in jobs.items()}
+        return {chart_id: json.loads(future.result()) for chart_id, future in futures.items()}
+
+
+class Page:
+    """The report's HTML body, with the chart specs it places collected on the side."""
+
+    def __init__(self, figures):
+        self.figures = figures
+        self.placed = []
+        self.parts = []
+
+    def add(self, markup):
+        self.parts.append(markup)
+
+    def heading(self, text, level=2):
+        self.add(f"<h{level}>{html.escape(text)}</h{level}>")
+
+    def text(self, text):
+        self.add(f"<p>{html.escape(text)}</p>")
+
+    def chart(self, chart_id):
+        div_id = f"chart-{len(self.placed)}"
+        self.placed.append({"id": div_id, "figure": self.figures[chart_id]})
+        return f'<div id="{div_id}"></div>'
+
+    def chart_with_data(self, chart_id, table):
+        return self.chart(chart_id) + view_data(table)
+
+    def tabs(self, panels):
+        buttons = "".join(f'<button class="{"active" if i == 0 else ""}">{html.escape(label)}</button>'
+                          for i, label in enumerate(panels))
+        bodies = "".join(f'<div class="tab-panel{" active" if i == 0 else ""}">{body}</div>'
+                         for i, body in enumerate(panels.values()))
+        self.add(f'<div class="tabs"><div class="tab-buttons">{buttons}</div>{bodies}</div>')
+
+    def row(self, *cells):
+        self.add('<div class="row">' + "".join(f"<div>{cell}</div>" for cell in cells) + "</div>")
+
+
+def view_data(table):
+    return f"<details><summary>View Data</summary>{tables.gradient_html(table)}</details>"
+
+
+def _image(file_name):
+    with open(os.path.join(IMAGES_DIR, file_name), "rb") as f:
+        data = base64.b64encode(f.read()).decode()
+    return f'<img src="data:image/png;base64,{data}" style="max-width: 100%">'
+
+
+def report_body(page, aggs):
+    page.heading("Key Findings", 1)
+
+    page.heading("Price")
+    price_table = aggs["price_stats"]
+    stats = price_stats.lookup(price_table)
+    figures = "".join(f"<li>{label}: {value}</li>" for label, value in [
+        ("Mean", f"${stats['mean']:,.2f}"), ("Median", f"${stats['median']:,.2f}"), ("Mode", f"${stats['mode']:,.2f}"),
+        ("Min", f"${stats['min']:,.2f}"), ("Max", f"${stats['max']:,.2f}"), ("Range", f"${stats['range']:,.2f}"),
+        ("Interquartile range", f"{stats['iqr']:,.2f}"), ("Standard deviation", f"{stats['std']:,.2f}"),
+        ("Outliers", f"{stats['outliers']:,.0f}"),
+    ])
+    page.row(_image("price_distribution.png"), f"<ul>{figures}</ul>")
+    breakdown = price_table[price_table["group_by"] != "all"].round(2).to_html(index=False)
+    page.add(f"<details><summary>Price Statistics By Borough &amp; Room Type</summary>{breakdown}</details>")
+
+    page.heading("Booked Days 365 & Price Correlation")
+    correlation = aggs["scatter_correlation"]["correlation"].iloc[0]
+    page.text(f"The correlation coefficient between Booked_Days_365 and Price is {correlation}")
+    page.tabs({"Binned": page.chart("scatter/Binned"), "Sample": page.chart("scatter/Sample")})
+
+    page.heading("Room Types")
+    page.row(page.chart_with_data("room_types_counts", aggs["room_types_counts"]),
+             page.chart_with_data("room_types_avg_price", aggs["room_types_avg_price"]))
+    table, _ = timeseries.series(aggs[timeseries.rollup_name("room_type")])
+    page.add(page.chart_with_data("booked_days_by_room_type", table))
+
+    page.heading("Boroughs & neighbourhoods")
+    page.row(page.chart_with_data("pie_data_listings", aggs["pie_data_listings"]),
+             page.chart_with_data("pie_data_yearly_reveneue", aggs["pie_data_yearly_reveneue"]))
+    page.tabs({rank_by: page.chart_with_data(f"neighbourhoods_top_10/{rank_by}", _top_neighbourhoods(aggs, rank_by, None))
+               for rank_by in leaderboard.METRICS})
+
+    page.heading("Price Ranges")
+    table, _ = timeseries.series(aggs[timeseries.rollup_name("price_range")])
+    page.add(page.chart_with_data("booked_days_by_price_range", table))
+    page.row(page.chart_with_data("price_ranges_by_listing_count", aggs["price_ranges_by_listing_count"]),
+             page.chart_with_data("price_ranges_by_price", aggs["price_ranges_by_price"]))
+
+    page.heading("Reviews")
+    page.add(page.chart_with_data("all_boroughs", aggs["all_boroughs"]))
+    page.tabs({borough: page.chart_with_data(f"reviews/{borough}", _borough_reviews(aggs, borough))
+               for borough in aggregates.BOROUGHS})
+
+
+def plotly_js():
+    from plotly.offline import get_plotlyjs
+    return get_plotlyjs()
+
+
+def write_report(path, page, version):
+    # A "</" inside the JSON would close the script element early
+    specs = json.dumps(page.placed).replace("</", "<\\/")
+    document = f"""<!DOCTYPE html>
+<html>
+<head>
+<meta charset="utf-8">
+<title>Pillow Palooza NYC Short-Term Rentals: Key Findings</title>
+<style>{STYLE}</style>
+<script>{plotly_js()}</script>
+</head>
+<body>
+{"".join(page.parts)}
+<p><small>Dataset version {html.escape(version)}</small></p>
+<script type="application/json" id="chart-specs">{specs}</script>
+<script>{SCRIPT}</script>
+</body>
+</html>
+"""
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        f.write(document)
+    os.replace(tmp_path, path)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Export the Key Findings report as a static HTML file.")
+    parser.add_argument("--out", help="directory to write to, by default Data/report/<dataset version>")
+    parser.add_argument("--workers", type=int, default=os.cpu_count(), help="chart rendering processes")
+    parser.add_argument("--png", action="store_true", help="also write every chart as a PNG (needs kaleido)")
+    parser.add_argument("--force", action="store_true", help="render again even if the report exists")
+    args = parser.parse_args()
+    if args.png and importlib.util.find_spec("kaleido") is None:
+        parser.error("--png needs the kaleido package")
+
+    version = data_loader.dataset_version()
+    out = args.out or os.path.join(REPORT_DIR, version)
+    path = os.path.join(out, "index.html")
+    if os.path.exists(path) and not args.force:
+        print(f"The report for {data_loader.LISTINGS_FILE} ({version}) is up to date: {path}")
+        return
+    os.makedirs(out, exist_ok=True)
+
+    # Build any missing aggregates once, so the workers only read them
+    aggs = aggregates.load_aggregates()
+    for _, names in aggregates.SECTIONS.values():
+        for name in names:
+            aggs[name]
+
+    page = Page(render_all(chart_jobs(), args.workers, out if args.png else None))
+    report_body(page, aggs)
+    write_report(path, page, version)
+    print(f"Wrote the report for {data_loader.LISTINGS_FILE} ({version}) to {path}")
+
+
+if __name__ == "__main__":
+    main()
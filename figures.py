@@ -0,0 +1,57 @@
+"""
+Cache of built charts.
+
+The Key Findings charts only change with the data behind them, yet every
+rerun used to build each Plotly and Altair figure again. The charts are now
+drawn through plotly_chart() and altair_chart() with a key made of the
+aggregate store's version (the dataset version, plus the filters for a
+filtered view), the chart id and the theme. The figure is built on the first
+miss only and kept, a Plotly figure as is and an Altair chart as its
+Vega-Lite dict; later reruns hand the stored one to st.plotly_chart or
+st.vega_lite_chart. The cache is shared by every session and evicts the least
+recently used charts beyond FIGURE_CACHE_BYTES of serialised spec.
+"""
+
+import json
+
+import streamlit as st
+
+import lru
+
+# Total size of the specs kept in the cache, as JSON
+FIGURE_CACHE_BYTES = 64 * 1024 * 1024
+
+
+_cache = lru.LRUCache(FIGURE_CACHE_BYTES)
+
+
+def figure_key(aggs, chart_id):
+    """Cache key for a chart drawn from the tables of aggs."""
+    return (aggs.version, chart_id, st.get_option("theme.base"))
+
+
+def _cached(key, build, size):
+    value = _cache.get(key)
+    if value is None:
+        value = build()
+        _cache.put(key, value, size(value))
+    return value
+
+
+def plotly_chart(key, build, use_container_width=True, theme="streamlit"):
+    """Draw the Plotly figure returned by build(), calling it only on a cache miss."""
+    figure = _cached(key, build, lambda figure: len(figure.to_json()))
+    st.plotly_chart(figure, use_container_width=use_container_width, theme=theme)
+
+
+def altair_chart(key, build, use_container_width=True, theme=None):
+    """Draw the Altair chart returned by build(), calling it only on a cache miss."""
+    def spec():
+        import altair as alt
+        # The full-dataset scatter is larger than Altair's default row limit
+        with alt.data_transformers.disable_max_rows():
+            return build().to_dict()
+
+    # st.vega_lite_chart copies the spec before changing it, so the cached dict is shared safely
+    spec = _cached(key, spec, lambda spec: len(json.dumps(spec)))
+    st.vega_lite_chart(spec, use_container_width=use_container_width, theme=theme)
@@ -0,0 +1,384 @@
+"""
+Sidebar filters over the listings.
+
+A FilterIndex is built once per dataset version. For every filter column it
+keeps the category code of each row and, per value, the sorted positions of
+the rows holding it; last_review is kept as day numbers plus the row order
+that sorts them, so a date window is two binary searches. A selection starts
+from the smallest candidate set (the positions of the chosen values of the
+most selective filter, or the rows inside the date window) and checks only
+those rows against the other filters, so the work scales with the matching
+rows rather than the whole dataset.
+
+A filtered view keeps only the matching positions. The state cubes behind most
+Key Findings tables are summed straight from the index codes at those
+positions with np.bincount; the map, price and scatter sections take just the
+columns they read. Each section is computed on first use, and recent
+selections are kept, so reruns that do not touch the filters reuse them.
+
+The sidebar options come from the unfiltered state tables, and the index is
+only built for the first filtered view, so a first paint without filters
+never loads the listings.
+
+With the SQLite backend (see sql_backend.py) the sidebar options come from the
+database and a selection becomes a WHERE clause on its indexed columns, so no
+listings are held in memory.
+"""
+
+import collections
+import hashlib
+import threading
+
+import numpy as np
+import pandas as pd
+
+import aggregates
+import data_loader
+import sql_backend
+
+FILTER_COLUMNS = ["borough", "neighbourhood", "room_type", "price_range"]
+DATE_COLUMN = "last_review"
+
+# Filtered views kept between reruns, newest last
+MAX_VIEWS = 8
+
+# Listing columns read by the sections that are not rolled up from the state cubes
+SECTION_COLUMNS = {
+    "map": ["latitude", "longitude", "price", "annual_revenue"],
+    "price": ["price", "borough", "room_type"],
+    "scatter": ["booked_days_365", "price", "borough"],
+}
+
+# Largest number of key combinations summed with dense np.bincount arrays
+MAX_DENSE_GROUPS = 1 << 24
+
+_indexes = {}
+_options = {}
+_views = collections.OrderedDict()
+_lock = threading.Lock()
+
+
+class FilterIndex:
+    """Per-value row positions for FILTER_COLUMNS and a sorted index on the review day."""
+
+    def __init__(self, data):
+        self.rows = len(data)
+        self.codes = {}
+        self.dtypes = {}
+        self.values = {}
+        self.positions = {}
+        for column in FILTER_COLUMNS:
+            categorical = data[column].astype("category")
+            codes = categorical.cat.codes.to_numpy()
+            # A stable sort keeps positions ascending within each value
+            order = np.argsort(codes, kind="stable").astype(np.int64)
+            counts = np.bincount(codes[codes >= 0], minlength=len(categorical.cat.categories))
+            starts = np.searchsorted(codes[order], 0)
+            self.codes[column] = codes
+            self.dtypes[column] = categorical.dtype
+            self.values[column] = list(categorical.cat.categories)
+            self.positions[column] = np.split(order[starts:], np.cumsum(counts)[:-1])
+
+        # Days since the epoch, rows without a review sort last and never match a window
+        days = data[DATE_COLUMN].to_numpy(dtype="datetime64[D]").astype(np.int64)
+        missing = data[DATE_COLUMN].isna().to_numpy()
+        days[missing] = np.iinfo(np.int64).max
+        self.days = days
+        self.day_order = np.argsort(days, kind="stable")
+        self.sorted_days = days[self.day_order]
+        self.reviewed = int((~missing).sum())
+
+        # Which neighbourhoods belong to each borough, for the sidebar options
+        pairs = data[["borough", "neighbourhood"]].drop_duplicates().dropna()
+        self.borough_neighbourhoods = pairs.groupby("borough", observed=True)["neighbourhood"].agg(sorted).to_dict()
+
+    def date_range(self):
+        if not self.reviewed:
+            return None
+        return (_to_date(self.sorted_days[0]), _to_date(self.sorted_days[self.reviewed - 1]))
+
+    def _value_codes(self, column, values):
+        lookup = {value: code for code, value in enumerate(self.values[column])}
+        return [lookup[value] for value in values if value in lookup]
+
+    def _window(self, dates):
+        start, end = (np.datetime64(date, "D").astype(np.int64) for date in dates)
+        return start, end, np.searchsorted(self.sorted_days, [start, end + 1])
+
+    def select(self, selection):
+        """
+        Sorted positions of the rows matching every filter in selection.
+
+        selection maps filter columns to lists of values and DATE_COLUMN to a
+        (start, end) pair of dates; empty entries do not filter.
+        """
+        candidates = []
+        for column in FILTER_COLUMNS:
+            if selection.get(column):
+                codes = self._value_codes(column, selection[column])
+                size = sum(len(self.positions[column][code]) for code in codes)
+                candidates.append((size, column, codes))
+        if selection.get(DATE_COLUMN):
+            start, end, (lo, hi) = self._window(selection[DATE_COLUMN])
+            candidates.append((hi - lo, DATE_COLUMN, (start, end, lo, hi)))
+        if not candidates:
+            return np.arange(self.rows)
+
+        candidates.sort(key=lambda candidate: candidate[0])
+        _, column, arg = candidates[0]
+        if column == DATE_COLUMN:
+            positions = np.sort(self.day_order[arg[2]:arg[3]])
+        else:
+            positions = np.sort(np.concatenate([self.positions[column][code] for code in arg] or [[]]).astype(np.int64))
+
+        for _, column, arg in candidates[1:]:
+            if column == DATE_COLUMN:
+                days = self.days[positions]
+                positions = positions[(days >= arg[0]) & (days <= arg[1])]
+            else:
+                allowed = np.zeros(len(self.values[column]) + 1, dtype=bool)
+                allowed[arg] = True
+                # Code -1 (missing) lands on the trailing False
+                positions = positions[allowed[self.codes[column][positions]]]
+        return positions
+
+    def sums(self, positions, dims, measures):
+        """
+        Sums of measures and the row count per combination of dims, over the rows at positions.
+
+        dims are filter columns or DATE_COLUMN, measures maps names to arrays
+        over all rows. Equals grouping the rows with observed=True and
+        dropna=False, computed from the codes instead of the values.
+        """
+        keys, shape = [], []
+        for dim in dims:
+            if dim == DATE_COLUMN:
+                # Days from the first review, missing ones one past the last
+                first = self.sorted_days[0] if self.reviewed else 0
+                span = int(self.sorted_days[self.reviewed - 1] - first + 1) if self.reviewed else 0
+                days = self.days[positions]
+                key = np.where(days == np.iinfo(np.int64).max, span, days - first)
+                shape.append(span + 1)
+            else:
+                codes = self.codes[dim][positions]
+                # Missing values group last, as they do in a groupby
+                key = np.where(codes < 0, len(self.values[dim]), codes)
+                shape.append(len(self.values[dim]) + 1)
+            keys.append(key)
+        combined = np.ravel_multi_index(keys, shape)
+        if np.prod(shape) <= MAX_DENSE_GROUPS:
+            counts = np.bincount(combined, minlength=np.prod(shape))
+            groups = np.flatnonzero(counts)
+            # Dense sums picked out at the non-empty groups
+            inverse, size, pick = combined, len(counts), groups
+        else:
+            groups, inverse = np.unique(combined, return_inverse=True)
+            size, pick = len(groups), slice(None)
+
+        table = {}
+        for dim, key in zip(dims, np.unravel_index(groups, shape)):
+            if dim == DATE_COLUMN:
+                dates = (key + first).astype("datetime64[D]").astype("datetime64[ns]")
+                dates[key == span] = np.datetime64("NaT")
+                table[dim] = dates
+            else:
+                codes = np.where(key == len(self.values[dim]), -1, key)
+                table[dim] = pd.Categorical.from_codes(codes, dtype=self.dtypes[dim]).remove_unused_categories()
+        for name, values in measures.items():
+            sums = np.bincount(inverse, weights=np.nan_to_num(values[positions], nan=0.0), minlength=size)[pick]
+            table[name] = sums.astype(np.int64) if np.issubdtype(values.dtype, np.integer) else sums
+        table["count"] = np.bincount(inverse, minlength=size)[pick]
+        return pd.DataFrame(table)
+
+
+def _to_date(day):
+    return np.datetime64(int(day), "D").astype(object)
+
+
+class FilterOptions:
+    """The sidebar options, read from the unfiltered state tables instead of a FilterIndex."""
+
+    def __init__(self, state_cube, state_daily):
+        self.values = {column: list(state_cube[column].astype("category").cat.categories) for column in FILTER_COLUMNS}
+        pairs = state_cube[["borough", "neighbourhood"]].drop_duplicates().dropna()
+        self.borough_neighbourhoods = pairs.groupby("borough", observed=True)["neighbourhood"].agg(sorted).to_dict()
+        reviewed = state_daily[DATE_COLUMN].dropna()
+        self._date_range = None if reviewed.empty else (reviewed.min().date(), reviewed.max().date())
+
+    def date_range(self):
+        return self._date_range
+
+
+class FilteredStore:
+    """
+    Key Findings tables for the listings of one selection.
+
+    Looks up like the aggregate store: each table is computed with the rest of
+    its section from the matching rows the first time it is used.
+    """
+
+    def __init__(self, index, positions, version):
+        self.index = index
+        self.positions = positions
+        self.version = version
+        self._tables = {}
+        self._lock = threading.Lock()
+
+    def listings(self, columns=None):
+        """The matching listings, optionally just some columns, with unused categories dropped."""
+        data = data_loader.load_listings()
+        data = (data if columns is None else data[columns]).iloc[self.positions]
+        categories = [c for c in data.columns if isinstance(data[c].dtype, pd.CategoricalDtype)]
+        return data.assign(**{c: data[c].cat.remove_unused_categories() for c in categories})
+
+    def __getitem__(self, name):
+        with self._lock:
+            if name not in self._tables:
+                self._load_section(aggregates.section_of(name))
+            return self._tables[name]
+
+    def _load_section(self, section_name):
+        if section_name == "state" or section_name in aggregates.STATE_SECTIONS:
+            # Both cubes feed every additive section at once
+            state = self._state()
+            self._tables.update(state)
+            self._tables.update(aggregates.derive_from_state(state["state_cube"], state["state_daily"]))
+        else:
+            builder, _ = aggregates.SECTIONS[section_name]
+            self._tables.update(builder(self.listings(SECTION_COLUMNS.get(section_name))))
+
+    def _state(self):
+        data = data_loader.load_listings()
+
+        def measures(names):
+            return {name: data[name].to_numpy() for name in names}
+
+        return {
+            "state_cube": self.index.sums(self.positions, aggregates.STATE_DIMS, measures(aggregates.STATE_MEASURES)),
+            "state_daily": self.index.sums(self.positions, aggregates.DAILY_DIMS, measures(aggregates.DAILY_MEASURES)),
+        }
+
+
+def load_index():
+    """The filter index for the current listings file, shared by every session."""
+    version = data_loader.dataset_version()
+    with _lock:
+        if version not in _indexes:
+            _indexes.clear()
+            _indexes[version] = FilterIndex(data_loader.load_listings())
+        return _indexes[version]
+
+
+def load_options():
+    """The sidebar options for the current listings file, without loading the listings."""
+    version = data_loader.dataset_version()
+    with _lock:
+        if version not in _options:
+            _options.clear()
+            if sql_backend.enabled():
+                _options[version] = sql_backend.SqlIndex()
+            else:
+                aggs = aggregates.load_aggregates()
+                _options[version] = FilterOptions(aggs["state_cube"], aggs["state_daily"])
+        return _options[version]
+
+
+def is_filtered(selection):
+    return any(selection.values())
+
+
+def selection_key(selection):
+    return tuple((column, tuple(value) if value else None) for column, value in sorted(selection.items()))
+
+
+def view_version(selection):
+    """The version of the store filtered_aggregates returns for selection, known without building it."""
+    version = data_loader.dataset_version()
+    if not is_filtered(selection):
+        return version
+    # Tells the views apart wherever the store's version is used as a cache key
+    return version + "-" + hashlib.sha1(repr(selection_key(selection)).encode()).hexdigest()[:12]
+
+
+def filtered_aggregates(selection):
+    """
+    Key Findings tables for the selection.
+
+    Without filters this is the precomputed aggregate store. Returns None when
+    no listing matches.
+    """
+    if not is_filtered(selection):
+        return aggregates.load_aggregates()
+
+    key = (data_loader.dataset_version(), selection_key(selection))
+    with _lock:
+        store = _views.get(key)
+        if store is not None:
+            _views.move_to_end(key)
+            return store
+
+    version = view_version(selection)
+    if sql_backend.enabled():
+        if not sql_backend.listing_count(selection):
+            return None
+        store = sql_backend.SqlStore(version, selection)
+    else:
+        index = load_index()
+        positions = index.select(selection)
+        if not len(positions):
+            return None
+        store = FilteredStore(index, positions, version)
+    with _lock:
+        _views[key] = store
+        while len(_views) > MAX_VIEWS:
+            _views.popitem(last=False)
+    return store
+
+
+def listings_for(aggs, columns=None):
+    """The listings behind a store returned by filtered_aggregates, optionally just some columns."""
+    if isinstance(aggs, (sql_backend.SqlStore, FilteredStore)):
+        return aggs.listings(columns)
+    if sql_backend.enabled():
+        return sql_backend.columns(columns)
+    data = data_loader.load_listings()
+    return data if columns is None else data[columns]
+
+
+def listing_count(aggs):
+    """Number of listings behind a store returned by filtered_aggregates."""
+    if isinstance(aggs, sql_backend.SqlStore):
+        return aggs.listing_count()
+    if isinstance(aggs, FilteredStore):
+        return len(aggs.positions)
+    # Every listing is counted once in the unfiltered state cube
+    return int(aggs["state_cube"]["count"].sum())
+
+
+def sidebar(index):
+    """Render the filter widgets in the sidebar and return the selection; index is what load_options returns."""
+    # Imported here so that the HTTP API (api.py) can use this module without Streamlit
+    import streamlit as st
+
+    st.sidebar.header("Filters")
+    selection = {}
+    selection["borough"] = st.sidebar.multiselect("Borough", index.values["borough"], key="filter_borough")
+
+    # Only offer the neighbourhoods of the chosen boroughs
+    if selection["borough"]:
+        neighbourhoods = sorted({n for b in selection["borough"] for n in index.borough_neighbourhoods.get(b, [])})
+    else:
+        neighbourhoods = index.values["neighbourhood"]
+    selection["neighbourhood"] = st.sidebar.multiselect("Neighbourhood", neighbourhoods, key="filter_neighbourhood")
+    selection["room_type"] = st.sidebar.multiselect("Room type", index.values["room_type"], key="filter_room_type")
+    selection["price_range"] = st.sidebar.multiselect("Price range", index.values["price_range"], key="filter_price_range")
+
+    date_range = index.date_range()
+    selection[DATE_COLUMN] = None
+    if date_range is not None:
+        window = st.sidebar.slider("Last review", min_value=date_range[0], max_value=date_range[1],
+                                   value=date_range, key="filter_last_review")
+        # The full range is the same as no date filter, and keeps listings without reviews
+        if tuple(window) != date_range:
+            selection[DATE_COLUMN] = tuple(window)
+    return selection
@@ -0,0 +1,93 @@
+"""
+Grid clustering of listing locations for the map.
+
+Listings are snapped to a square grid of latitude/longitude cells and each
+non-empty cell becomes one point at the centroid of its listings, carrying the
+listing count, average price and total annual revenue. Coarser grids are used
+for zoomed-out views, so the map always covers the full dataset while the
+number of points sent to the browser stays bounded by the number of cells.
+"""
+
+import numpy as np
+import pandas as pd
+
+# Map detail level -> grid cell size in degrees (about 2 km, 500 m and 250 m)
+ZOOM_LEVELS = {
+    "City": 0.02,
+    "Neighbourhood": 0.005,
+    "Block": 0.0025,
+}
+
+# Light yellow to dark red, used for the low and high ends of the colour scale
+LOW_COLOR = np.array([255, 237, 160])
+HIGH_COLOR = np.array([189, 0, 38])
+
+
+def cell_sums(data, cell_size):
+    """
+    Per non-empty grid cell (row, col): the listing count and the sums behind its centroid and averages.
+
+    Sums of different sets of listings add up, so the clusters of a file too
+    large to load can be built chunk by chunk (see streaming.py).
+    """
+    latitude = data["latitude"].to_numpy(dtype=np.float64)
+    longitude = data["longitude"].to_numpy(dtype=np.float64)
+    valid = ~(np.isnan(latitude) | np.isnan(longitude))
+    price = data["price"].to_numpy(dtype=np.float64)[valid]
+
+    cells = pd.DataFrame({
+        "row": np.floor(latitude[valid] / cell_size).astype(np.int64),
+        "col": np.floor(longitude[valid] / cell_size).astype(np.int64),
+        "latitude": latitude[valid],
+        "longitude": longitude[valid],
+        "price": price,
+        "priced": ~np.isnan(price),
+        "annual_revenue": data["annual_revenue"].to_numpy()[valid],
+    })
+    grouped = cells.groupby(["row", "col"])
+    sums = grouped[["latitude", "longitude", "price", "priced", "annual_revenue"]].sum()
+    sums["listings"] = grouped.size()
+    return sums.reset_index()
+
+
+def clusters_from_sums(sums):
+    """One row per grid cell with its centroid and listing totals, ordered by cell."""
+    sums = sums.sort_values(["row", "col"])
+    return pd.DataFrame({
+        "latitude": sums["latitude"] / sums["listings"],
+        "longitude": sums["longitude"] / sums["listings"],
+        "listings": sums["listings"],
+        "avg_price": sums["price"] / sums["priced"],
+        "annual_revenue": sums["annual_revenue"],
+    }).reset_index(drop=True)
+
+
+def grid_clusters(data, cell_size):
+    """One row per non-empty grid cell with its centroid and listing totals."""
+    return clusters_from_sums(cell_sums(data, cell_size))
+
+
+def build_levels(data):
+    """Clusters for every entry in ZOOM_LEVELS."""
+    return {level: grid_clusters(data, cell_size) for level, cell_size in ZOOM_LEVELS.items()}
+
+
+def color_scale(values):
+    """
+    Hex colours for values, from LOW_COLOR to HIGH_COLOR by percentile rank.
+
+    Ranking keeps a handful of very expensive cells from washing out the rest.
+    """
+    ranks = pd.Series(values).rank(pct=True).fillna(0).to_numpy()[:, None]
+    rgb = np.rint(LOW_COLOR + (HIGH_COLOR - LOW_COLOR) * ranks).astype(int)
+    return ["#{:02x}{:02x}{:02x}".format(*c) for c in rgb]
+
+
+def map_points(clusters, level, color_by="avg_price"):
+    """Clusters with the color and size (metres) columns st.map expects."""
+    points = clusters.copy()
+    points["color"] = color_scale(points[color_by])
+    # Area grows with the listing count, the largest dot about fills its cell
+    cell_metres = ZOOM_LEVELS[level] * 111_000
+    points["size"] = cell_metres / 2 * np.sqrt(points["listings"] / points["listings"].max())
+    return points
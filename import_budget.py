@@ -0,0 +1,84 @@
+"""
+Import-time budget for short_rental.py.
+
+    python import_budget.py [--budget SECONDS]
+
+Runs the module-level imports of short_rental.py in a fresh interpreter with
+-X importtime, prints the slowest of them, and exits with status 1 when they
+take longer than the budget or when a heavy plotting or IO library is loaded
+at startup. Those belong inside the sections that draw with them.
+"""
+
+import argparse
+import ast
+import os
+import subprocess
+import sys
+
+APP_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "short_rental.py")
+
+DEFAULT_BUDGET = 1.5
+
+# Libraries that must not be imported before the first paint
+HEAVY_MODULES = ["matplotlib", "seaborn", "plotly.express", "altair", "openpyxl"]
+
+
+def startup_imports(path=APP_FILE):
+    """Source of the import statements at the top level of the app."""
+    with open(path, encoding="utf-8") as f:
+        tree = ast.parse(f.read())
+    return [ast.unparse(node) for node in tree.body if isinstance(node, (ast.Import, ast.ImportFrom))]
+
+
+def _import_times(code):
+    result = subprocess.run([sys.executable, "-X", "importtime", "-c", code], cwd=os.path.dirname(APP_FILE),
+                            capture_output=True, text=True, check=True)
+    timings = {}
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, name = line[len("import time:"):].split("|")
+        # Nested imports are indented under the module that triggered them
+        if not name[1:].startswith(" "):
+            timings[name.strip()] = int(cumulative) / 1e6
+    return timings, result.stdout
+
+
+def measure(imports):
+    """Seconds per top-level import, slowest first, and the heavy modules that got loaded."""
+    code = "\n".join(imports + [
+        "import sys",
+        f"print(','.join(m for m in {HEAVY_MODULES!r} if m in sys.modules))",
+    ])
+    timings, output = _import_times(code)
+    # Leave out what the interpreter imports on its own before running anything
+    interpreter, _ = _import_times("pass")
+    timings = {name: seconds for name, seconds in timings.items() if name not in interpreter}
+    heavy = [m for m in output.strip().split(",") if m]
+    return sorted(timings.items(), key=lambda item: item[1], reverse=True), heavy
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Check the startup import time of short_rental.py.")
+    parser.add_argument("--budget", type=float, default=DEFAULT_BUDGET, help="seconds allowed for all imports")
+    parser.add_argument("--top", type=int, default=10, help="number of slowest imports to list")
+    args = parser.parse_args()
+
+    timings, heavy = measure(startup_imports())
+    total = sum(seconds for _, seconds in timings)
+    for name, seconds in timings[:args.top]:
+        print(f"{seconds:8.3f}s  {name}")
+    print(f"{total:8.3f}s  total (budget {args.budget:.3f}s)")
+
+    failed = False
+    if total > args.budget:
+        print("Over the import-time budget")
+        failed = True
+    if heavy:
+        print("Loaded at startup: " + ", ".join(heavy))
+        failed = True
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
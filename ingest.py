@@ -0,0 +1,120 @@
+"""
+Parallel parsing of the three source files.
+
+    python ingest.py [--workers N] [--chunk-bytes N]
+
+pandas parses a file on a single core, and reading prices.csv, room_types.xlsx
+and reviews.tsv one after another costs the sum of the three. read_sources()
+gives every source to its own worker process instead: room_types.xlsx (the
+openpyxl parse is slower than the other two together) and reviews.tsv as whole
+files, and prices.csv split into byte ranges that end on line boundaries so
+several cores parse it at once. The Excel file is submitted first, so with
+enough workers the total approaches the time of the slowest single part.
+
+Every part is cleaned by the parsers in sources.py before it comes back: prices
+with numeric prices and borough and neighbourhood split out, room types and
+reviews indexed on listing_id and ready for etl.hash_join.
+"""
+
+import argparse
+import concurrent.futures
+import io
+import os
+import time
+
+import pandas as pd
+
+import data_loader
+import sources
+
+# Byte ranges of prices.csv handed to one worker
+DEFAULT_CHUNK_BYTES = 8 * 1024 * 1024
+
+
+def csv_ranges(path, chunk_bytes=DEFAULT_CHUNK_BYTES):
+    """
+    (start, end) byte offsets covering the rows of a CSV file after its header.
+
+    Every range ends just after a newline, so no row is split. Only valid for
+    files without quoted newlines, which holds for prices.csv.
+    """
+    size = os.path.getsize(path)
+    ranges = []
+    with open(path, "rb") as f:
+        f.readline()
+        start = f.tell()
+        while start < size:
+            f.seek(min(start + chunk_bytes, size))
+            f.readline()
+            end = min(f.tell(), size)
+            ranges.append((start, end))
+            start = end
+    return ranges
+
+
+def read_csv_range(path, start, end, **read_args):
+    """Parse the rows between two byte offsets, using the file's own header."""
+    with open(path, "rb") as f:
+        header = f.readline()
+        f.seek(start)
+        body = f.read(end - start)
+    return pd.read_csv(io.BytesIO(header + body), **read_args)
+
+
+def parse_prices_range(path, start, end):
+    return sources.parse_prices(read_csv_range(path, start, end, **sources.PRICES_READ_ARGS))
+
+
+def _tasks(chunk_bytes):
+    """(source, function, args) for every part, slowest first."""
+    prices_path = data_loader.data_path(data_loader.PRICES_FILE)
+    tasks = [
+        ("room_types", sources.parse_room_types_file, (data_loader.data_path(data_loader.ROOM_TYPES_FILE),)),
+        ("reviews", sources.parse_reviews_file, (data_loader.data_path(data_loader.REVIEWS_FILE),)),
+    ]
+    tasks += [("prices", parse_prices_range, (prices_path, start, end))
+              for start, end in csv_ranges(prices_path, chunk_bytes)]
+    return tasks
+
+
+def read_sources(workers=None, chunk_bytes=DEFAULT_CHUNK_BYTES):
+    """
+    Parse the three sources concurrently.
+
+    Returns a dict with the cleaned prices frame and the room_types and reviews
+    lookups. workers=1 parses everything in this process.
+    """
+    tasks = _tasks(chunk_bytes)
+    if workers == 1:
+        results = [function(*args) for _, function, args in tasks]
+    else:
+        with concurrent.futures.ProcessPoolExecutor(max_workers=workers) as pool:
+            futures = [pool.submit(function, *args) for _, function, args in tasks]
+            results = [future.result() for future in futures]
+
+    parts = {}
+    for (source, _, _), result in zip(tasks, results):
+        parts.setdefault(source, []).append(result)
+    return {
+        "prices": pd.concat(parts["prices"], ignore_index=True),
+        "room_types": parts["room_types"][0],
+        "reviews": parts["reviews"][0],
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--workers", type=int, help="worker processes (default: one per core)")
+    parser.add_argument("--chunk-bytes", type=int, default=DEFAULT_CHUNK_BYTES)
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    parsed = read_sources(args.workers, args.chunk_bytes)
+    elapsed = time.perf_counter() - start
+    for name, frame in parsed.items():
+        print(f"{name}: {len(frame):,} rows")
+    print(f"Parsed the sources in {elapsed:.2f}s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,68 @@
+"""
+Neighbourhood leaderboard.
+
+One row per (borough, neighbourhood) with its annual revenue, average price,
+listing count and average booked days, built from the same sums as the other
+Boroughs tables and stored with the aggregates, so it is rebuilt (or patched
+by refresh.py) whenever the listings change. Top-k queries use a partial
+selection (np.argpartition) and only sort the k winners, instead of sorting
+every neighbourhood.
+"""
+
+import numpy as np
+import pandas as pd
+
+# Label in the app -> metric column
+METRICS = {
+    "Revenue": "annual_revenue",
+    "Average Price": "avg_price",
+    "Listings": "total_listings",
+    "Average Booked Days": "avg_booked_days",
+}
+
+
+def from_sums(sums):
+    """
+    Leaderboard table from annual_revenue, price, booked_days_365 and count
+    summed per (borough, neighbourhood).
+    """
+    sums = sums[sums["count"] > 0]
+    return pd.DataFrame({
+        "borough": sums["borough"].astype(str).to_numpy(),
+        "neighbourhood": sums["neighbourhood"].astype(str).to_numpy(),
+        "annual_revenue": sums["annual_revenue"].to_numpy(),
+        "avg_price": (sums["price"] / sums["count"]).to_numpy(),
+        "total_listings": sums["count"].to_numpy(),
+        "avg_booked_days": (sums["booked_days_365"] / sums["count"]).to_numpy(),
+    })
+
+
+def build(data):
+    grouped = data.groupby(["borough", "neighbourhood"], observed=True)
+    sums = grouped[["annual_revenue", "price", "booked_days_365"]].sum()
+    sums["count"] = grouped.size()
+    return from_sums(sums.reset_index())
+
+
+class Leaderboard:
+    """Top-k neighbourhoods by any metric column, overall or inside one borough."""
+
+    def __init__(self, table):
+        self.table = table
+        self.boroughs = table["borough"].to_numpy()
+        self.metrics = {metric: table[metric].to_numpy(dtype=np.float64) for metric in METRICS.values()}
+
+    def top(self, metric, k=10, borough=None):
+        """The k rows with the highest metric, best first."""
+        positions = np.arange(len(self.table))
+        if borough is not None:
+            positions = positions[self.boroughs == borough]
+        # Missing values rank last
+        values = np.nan_to_num(self.metrics[metric][positions], nan=-np.inf)
+
+        if k < len(positions):
+            best = np.argpartition(-values, k - 1)[:k]
+        else:
+            best = np.arange(len(positions))
+        best = best[np.argsort(-values[best], kind="stable")]
+        return self.table.iloc[positions[best]].reset_index(drop=True)
@@ -0,0 +1,45 @@
+"""
+Size-bounded least recently used cache.
+
+Shared by the chart cache of the app (figures.py) and the response cache of
+the HTTP API (api.py). It depends on nothing but the standard library, so the
+API can use it without importing Streamlit.
+"""
+
+import collections
+import threading
+
+
+class LRUCache:
+    """Least recently used mapping of keys to values, bounded by their total size."""
+
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self.bytes = 0
+        self._entries = collections.OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            self._entries.move_to_end(key)
+            return entry[0]
+
+    def put(self, key, value, size=None):
+        """Keep value under key; size is its weight in bytes, len(value) by default."""
+        size = len(value) if size is None else size
+        with self._lock:
+            if key in self._entries:
+                self.bytes -= self._entries.pop(key)[1]
+            if size > self.max_bytes:
+                return
+            self._entries[key] = (value, size)
+            self.bytes += size
+            while self.bytes > self.max_bytes:
+                _, (_, evicted) = self._entries.popitem(last=False)
+                self.bytes -= evicted
@@ -0,0 +1,191 @@
+"""
+Summary statistics for the Price section.
+
+All figures for a set of prices come from one sorted NumPy array: the mean and
+standard deviation from its sums, the quartiles and median by position, the
+mode from run lengths and the IQR outlier count by binary search, so no
+boolean-masked copy of the listings is ever built. Group breakdowns sort once
+by (group, price) and describe each contiguous segment.
+"""
+
+import numpy as np
+import pandas as pd
+
+STAT_COLUMNS = ["count", "mean", "std", "min", "q1", "median", "q3", "max",
+                "range", "iqr", "mode", "outliers"]
+
+
+def _quantile(sorted_values, q):
+    # Linear interpolation, the same as pandas' default
+    position = (len(sorted_values) - 1) * q
+    lower = int(np.floor(position))
+    upper = min(lower + 1, len(sorted_values) - 1)
+    return sorted_values[lower] + (sorted_values[upper] - sorted_values[lower]) * (position - lower)
+
+
+def describe_sorted(sorted_values):
+    """Statistics for an already sorted array without NaNs."""
+    n = len(sorted_values)
+    if n == 0:
+        empty = dict.fromkeys(STAT_COLUMNS, np.nan)
+        empty.update(count=0, outliers=0)
+        return empty
+
+    total = sorted_values.sum(dtype=np.float64)
+    mean = total / n
+    std = np.sqrt(((sorted_values - mean) ** 2).sum() / (n - 1)) if n > 1 else np.nan
+
+    q1 = _quantile(sorted_values, 0.25)
+    q3 = _quantile(sorted_values, 0.75)
+    iqr = q3 - q1
+
+    # Most common value: the longest run in the sorted array (lowest on ties)
+    run_starts = np.flatnonzero(np.r_[True, sorted_values[1:] != sorted_values[:-1]])
+    run_lengths = np.diff(np.r_[run_starts, n])
+    mode = sorted_values[run_starts[np.argmax(run_lengths)]]
+
+    below = np.searchsorted(sorted_values, q1 - 1.5 * iqr, side="left")
+    above = n - np.searchsorted(sorted_values, q3 + 1.5 * iqr, side="right")
+
+    return {
+        "count": n,
+        "mean": mean,
+        "std": std,
+        "min": sorted_values[0],
+        "q1": q1,
+        "median": _quantile(sorted_values, 0.5),
+        "q3": q3,
+        "max": sorted_values[-1],
+        "range": sorted_values[-1] - sorted_values[0],
+        "iqr": iqr,
+        "mode": mode,
+        "outliers": int(below + above),
+    }
+
+
+def describe_counts(values, counts):
+    """
+    Statistics for sorted distinct values and how often each occurs.
+
+    Gives the same figures as describe_sorted on the expanded array, without
+    ever building it.
+    """
+    counts = np.asarray(counts, dtype=np.int64)
+    n = int(counts.sum())
+    if n == 0:
+        return describe_sorted(np.array([]))
+
+    cumulative = np.cumsum(counts)
+
+    def at(position):
+        return values[np.searchsorted(cumulative, position, side="right")]
+
+    def quantile(q):
+        position = (n - 1) * q
+        lower = int(np.floor(position))
+        upper = min(lower + 1, n - 1)
+        return at(lower) + (at(upper) - at(lower)) * (position - lower)
+
+    mean = (values * counts).sum() / n
+    std = np.sqrt((counts * (values - mean) ** 2).sum() / (n - 1)) if n > 1 else np.nan
+    q1, q3 = quantile(0.25), quantile(0.75)
+    iqr = q3 - q1
+    below = counts[:np.searchsorted(values, q1 - 1.5 * iqr, side="left")].sum()
+    above = counts[np.searchsorted(values, q3 + 1.5 * iqr, side="right"):].sum()
+
+    return {
+        "count": n,
+        "mean": mean,
+        "std": std,
+        "min": values[0],
+        "q1": q1,
+        "median": quantile(0.5),
+        "q3": q3,
+        "max": values[-1],
+        "range": values[-1] - values[0],
+        "iqr": iqr,
+        # argmax takes the first, so the lowest value on ties as in describe_sorted
+        "mode": values[np.argmax(counts)],
+        "outliers": int(below + above),
+    }
+
+
+def describe(values):
+    """Statistics for any array-like of prices; NaNs are ignored."""
+    values = np.asarray(values, dtype=np.float64)
+    values = np.sort(values[~np.isnan(values)])
+    return describe_sorted(values)
+
+
+def describe_by(data, key, value="price"):
+    """One row of statistics per value of the key column."""
+    values = data[value].to_numpy(dtype=np.float64)
+    groups = pd.Categorical(data[key])
+    codes = groups.codes
+
+    keep = ~np.isnan(values) & (codes >= 0)
+    values, codes = values[keep], codes[keep]
+    order = np.lexsort((values, codes))
+    values, codes = values[order], codes[order]
+
+    bounds = np.searchsorted(codes, np.arange(len(groups.categories) + 1))
+    rows = [describe_sorted(values[bounds[i]:bounds[i + 1]]) for i in range(len(groups.categories))]
+    table = pd.DataFrame(rows, columns=STAT_COLUMNS)
+    table.insert(0, key, groups.categories)
+    return table
+
+
+def stats_table(data, breakdowns=("borough", "room_type"), value="price"):
+    """
+    Statistics for the whole dataset and for each breakdown, in one table.
+
+    Rows are labelled by group_by ("all" or the breakdown column) and group.
+    """
+    overall = pd.DataFrame([describe(data[value])], columns=STAT_COLUMNS)
+    overall.insert(0, "group", "all")
+    overall.insert(0, "group_by", "all")
+
+    tables = [overall]
+    for key in breakdowns:
+        table = describe_by(data, key, value).rename(columns={key: "group"})
+        table["group"] = table["group"].astype(str)
+        table.insert(0, "group_by", key)
+        tables.append(table)
+    return pd.concat(tables, ignore_index=True)
+
+
+def value_counts(data, breakdowns=("borough", "room_type"), value="price"):
+    """The counts frame stats_table_from_counts takes: listings per breakdown values and value."""
+    keys = list(breakdowns) + [value]
+    return data.groupby(keys, observed=True, dropna=False).size().rename("count").reset_index()
+
+
+def stats_table_from_counts(counts, breakdowns=("borough", "room_type"), value="price"):
+    """
+    stats_table from a frame of value counts instead of the listings.
+
+    counts has the breakdown columns, the value column and a "count" column
+    with the number of listings holding each combination.
+    """
+    def describe_rows(rows):
+        rows = rows[rows[value].notna()].groupby(value)["count"].sum()
+        return describe_counts(rows.index.to_numpy(dtype=np.float64), rows.to_numpy())
+
+    overall = pd.DataFrame([describe_rows(counts)], columns=STAT_COLUMNS)
+    overall.insert(0, "group", "all")
+    overall.insert(0, "group_by", "all")
+
+    tables = [overall]
+    for key in breakdowns:
+        groups = sorted(counts[key].dropna().unique())
+        table = pd.DataFrame([describe_rows(counts[counts[key] == group]) for group in groups], columns=STAT_COLUMNS)
+        table.insert(0, "group", [str(group) for group in groups])
+        table.insert(0, "group_by", key)
+        tables.append(table)
+    return pd.concat(tables, ignore_index=True)
+
+
+def lookup(table, group_by="all", group="all"):
+    """The statistics row for one group as a dict."""
+    row = table[(table["group_by"] == group_by) & (table["group"] == group)]
+    return row.iloc[0][STAT_COLUMNS].to_dict()
@@ -0,0 +1,205 @@
+"""
+Per-section render profiling for short_rental.py.
+
+Wrap each block of the script in profile.section(name). When profiling is on
+for a run, every section records its wall time, peak traced memory and the
+serialised size of the charts and tables it sends to the browser. Finished
+runs are logged to the "rental.profiling" logger and kept in memory for the
+admin panel (open the app with ?admin=1, or set RENTAL_PROFILE=1 to profile
+every run).
+
+The Streamlit output functions are wrapped, and tracemalloc runs, only while
+a profiled section is open in some session; the last one to close restores
+the functions and stops tracing. Tracing starts afresh for a section that
+opens alone, so its peak is its own. When sections of several sessions
+overlap, the traced peak is shared and each reads an upper bound of its own.
+
+When profiling is off, sections cost a couple of attribute lookups.
+"""
+
+import collections
+import contextlib
+import io
+import json
+import logging
+import os
+import sys
+import threading
+import time
+import tracemalloc
+
+import pandas as pd
+import streamlit as st
+
+logger = logging.getLogger("rental.profiling")
+
+# Streamlit functions whose arguments are measured as page payload
+PAYLOAD_FUNCTIONS = ["plotly_chart", "altair_chart", "vega_lite_chart", "dataframe",
+                     "table", "write", "map", "image", "markdown"]
+
+# Finished runs kept for the admin panel, newest last
+RECENT_RUNS = collections.deque(maxlen=50)
+
+_local = threading.local()
+_lock = threading.Lock()
+# Profiled sections open in any session, the functions they wrapped and
+# whether they started tracemalloc (rather than python -X tracemalloc)
+_open_sections = 0
+_originals = {}
+_tracing = False
+
+
+def payload_size(obj):
+    """Approximate number of bytes obj adds to the page."""
+    if obj is None:
+        return 0
+    if isinstance(obj, str):
+        return len(obj.encode())
+    if isinstance(obj, dict):
+        # Chart specs such as Vega-Lite dicts
+        return len(json.dumps(obj, default=str))
+    if isinstance(obj, pd.DataFrame):
+        import pyarrow as pa
+        return pa.Table.from_pandas(obj).nbytes
+    # Importing Styler pulls in matplotlib, and nothing can be one until it is loaded
+    style = sys.modules.get("pandas.io.formats.style")
+    if style is not None and isinstance(obj, style.Styler):
+        return len(obj.to_html().encode())
+    if hasattr(obj, "to_json"):
+        # Plotly figures and Altair charts serialise themselves
+        return len(obj.to_json())
+    if hasattr(obj, "save"):
+        # PIL images, measured as PNG
+        buffer = io.BytesIO()
+        obj.save(buffer, format="PNG")
+        return buffer.tell()
+    return 0
+
+
+def record_element(*objects):
+    """Count one element sent to the page, made of objects, in the current section."""
+    record = getattr(_local, "record", None)
+    if record is None:
+        return
+    try:
+        record["payload_bytes"] += sum(payload_size(obj) for obj in objects)
+    except Exception:
+        # Measuring must never break the page
+        logger.debug("Could not measure payload", exc_info=True)
+    record["elements"] += 1
+
+
+def _measured(name, function):
+    def wrapper(*args, **kwargs):
+        record_element(*args)
+        return function(*args, **kwargs)
+    wrapper.__wrapped__ = function
+    wrapper.__name__ = name
+    return wrapper
+
+
+def _open():
+    """Wrap the output functions and trace memory, unless another section already does."""
+    global _open_sections, _tracing
+    with _lock:
+        _open_sections += 1
+        if _open_sections == 1:
+            for name in PAYLOAD_FUNCTIONS:
+                _originals[name] = getattr(st, name)
+                setattr(st, name, _measured(name, _originals[name]))
+            _tracing = not tracemalloc.is_tracing()
+            if _tracing:
+                tracemalloc.start()
+
+
+def _close():
+    """Undo _open once the last open section closes."""
+    global _open_sections
+    with _lock:
+        _open_sections -= 1
+        if _open_sections == 0:
+            if _tracing:
+                tracemalloc.stop()
+            for name, function in _originals.items():
+                setattr(st, name, function)
+            _originals.clear()
+
+
+def profiling_requested():
+    if os.environ.get("RENTAL_PROFILE") == "1":
+        return True
+    params = st.experimental_get_query_params()
+    return params.get("admin", ["0"])[0] == "1"
+
+
+class RunProfile:
+    """Timings for one run of the script."""
+
+    def __init__(self, enabled):
+        self.enabled = enabled
+        self.started = time.time()
+        self.sections = []
+
+    @contextlib.contextmanager
+    def section(self, name):
+        if not self.enabled:
+            yield None
+            return
+
+        record = {"section": name, "seconds": 0.0, "peak_memory_bytes": 0,
+                  "payload_bytes": 0, "elements": 0}
+        outer = getattr(_local, "record", None)
+        _local.record = record
+        _open()
+        start_memory = tracemalloc.get_traced_memory()[0]
+        start = time.perf_counter()
+        try:
+            yield record
+        finally:
+            record["seconds"] = time.perf_counter() - start
+            record["peak_memory_bytes"] = max(tracemalloc.get_traced_memory()[1] - start_memory, 0)
+            _close()
+            _local.record = outer
+            self.sections.append(record)
+
+    def finish(self):
+        if not self.enabled:
+            return
+        run = {"started": self.started, "sections": self.sections}
+        RECENT_RUNS.append(run)
+        for record in self.sections:
+            logger.info("%s: %.3fs, peak %d bytes, payload %d bytes in %d elements",
+                        record["section"], record["seconds"], record["peak_memory_bytes"],
+                        record["payload_bytes"], record["elements"])
+
+    def table(self):
+        return pd.DataFrame(self.sections, columns=["section", "seconds", "peak_memory_bytes",
+                                                    "payload_bytes", "elements"])
+
+
+def start_run():
+    return RunProfile(enabled=profiling_requested())
+
+
+def recent_summary():
+    """Mean and worst time, memory and payload per section over the recent runs."""
+    records = [record for run in RECENT_RUNS for record in run["sections"]]
+    if not records:
+        return pd.DataFrame()
+    table = pd.DataFrame(records)
+    return table.groupby("section").agg(runs=("seconds", "size"),
+                                        mean_seconds=("seconds", "mean"),
+                                        max_seconds=("seconds", "max"),
+                                        max_peak_memory_bytes=("peak_memory_bytes", "max"),
+                                        mean_payload_bytes=("payload_bytes", "mean")).reset_index()
+
+
+def admin_panel(profile):
+    """Render the timings of this run and of recent runs in the sidebar."""
+    if not profile.enabled:
+        return
+    with st.sidebar.expander("Render profile", expanded=True):
+        st.caption("This run")
+        st.dataframe(profile.table(), hide_index=True)
+        st.caption(f"Last {len(RECENT_RUNS)} runs")
+        st.dataframe(recent_summary(), hide_index=True)
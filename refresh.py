@@ -0,0 +1,166 @@
+"""
+Incremental refresh of the listings dataset and its aggregates.
+
+    python refresh.py DELTA_FILE
+    python refresh.py --compact
+
+The delta file (CSV or Parquet) has the columns of pillow_final.csv plus an
+optional "change" column. Rows marked "delete" remove the listing with that
+listing_id; every other row adds the listing or replaces the stored one.
+
+The delta is appended to the change log of the listings file (see
+data_loader), which is merged over the CSV on load; the CSV itself is not
+touched. Only the current rows of the changed listings are read back.
+
+Most tables roll up from additive tables in the aggregate store: the state
+cubes behind the Room Types, Boroughs, Price Ranges, time series and Reviews
+tables, the per cell sums behind the map clusters and the count of every
+price behind the price statistics. A refresh subtracts the old rows of the
+changed listings from those tables, adds the new rows and derives the rest
+again, so all of its work scales with the size of the delta. Only the
+scatter views are not additive; they are rebuilt lazily on first use.
+
+--compact folds the change log back into the CSV once it has grown long.
+"""
+
+import argparse
+import os
+import shutil
+import time
+
+import pandas as pd
+
+import aggregates
+import data_loader
+import geo
+import price_stats
+
+# Key columns and listing count column of every table a refresh patches
+PATCHED_TABLES = {
+    "state_cube": (aggregates.STATE_DIMS, "count"),
+    "state_daily": (aggregates.DAILY_DIMS, "count"),
+    "price_counts": (["borough", "room_type", "price"], "count"),
+}
+PATCHED_TABLES.update({aggregates.map_cells_table(level): (["row", "col"], "listings") for level in geo.ZOOM_LEVELS})
+
+# The sections those tables belong to
+PATCHED_SECTIONS = ["state", "map_cells", "price_counts"]
+
+
+def read_delta(path):
+    if path.endswith(".parquet"):
+        delta = pd.read_parquet(path)
+    else:
+        delta = pd.read_csv(path, usecols=lambda c: not c.startswith("Unnamed: 0"))
+    if "change" not in delta:
+        delta["change"] = "upsert"
+    # Only the last change to a listing counts
+    return delta.drop_duplicates("listing_id", keep="last")
+
+
+def _align_categories(frames, dims):
+    """Give categorical dims the same categories in every frame, old ones first."""
+    for dim in dims:
+        dtypes = [f[dim].dtype for f in frames if isinstance(f[dim].dtype, pd.CategoricalDtype)]
+        if not dtypes:
+            continue
+        categories = pd.Index(dtypes[0].categories)
+        for frame in frames:
+            values = frame[dim].cat.categories if isinstance(frame[dim].dtype, pd.CategoricalDtype) else frame[dim].dropna().unique()
+            categories = categories.append(pd.Index(values).difference(categories))
+        dtype = pd.CategoricalDtype(categories, ordered=dtypes[0].ordered)
+        for frame in frames:
+            frame[dim] = frame[dim].astype(dtype)
+    return frames
+
+
+def patch_state(state, removed, added, dims, count="count"):
+    """Subtract the removed state from state, add the added state, drop empty groups."""
+    measures = [c for c in state.columns if c not in dims]
+    removed = removed.copy()
+    removed[measures] = -removed[measures]
+    frames = _align_categories([state.copy(), removed, added.copy()], dims)
+
+    patched = pd.concat(frames, ignore_index=True)
+    patched = patched.groupby(dims, observed=True, dropna=False)[measures].sum().reset_index()
+    return patched[patched[count] > 0].reset_index(drop=True)
+
+
+def additive_tables(data):
+    """The PATCHED_TABLES of a frame of listings."""
+    tables = {}
+    for name in PATCHED_SECTIONS:
+        builder, _ = aggregates.SECTIONS[name]
+        tables.update(builder(data))
+    return tables
+
+
+def refresh(delta_path):
+    """Apply a delta file and return a summary of what changed."""
+    store = aggregates.load_aggregates()
+
+    delta = read_delta(delta_path)
+    removed = data_loader.read_listing_rows(delta["listing_id"])
+    # Deletes may come with just a listing_id, the change log keeps every column
+    columns = [c for c in removed.columns if c not in data_loader.DERIVED_COLUMNS]
+    delta = delta.reindex(columns=columns + ["change"])
+
+    added = delta[delta["change"] != "delete"].drop(columns="change").reset_index(drop=True)
+    added = data_loader.apply_schema(added)
+    data_loader.add_derived_columns(added)
+
+    # Patch the additive tables with just the changed rows
+    removed_tables, added_tables = additive_tables(removed), additive_tables(added)
+    tables = {name: patch_state(store[name], removed_tables[name], added_tables[name], dims, count)
+              for name, (dims, count) in PATCHED_TABLES.items()}
+    tables.update(aggregates.derive_from_state(tables["state_cube"], tables["state_daily"]))
+    for level in geo.ZOOM_LEVELS:
+        tables[aggregates.map_table(level)] = geo.clusters_from_sums(tables[aggregates.map_cells_table(level)])
+    tables["price_stats"] = price_stats.stats_table_from_counts(tables["price_counts"])
+
+    # Log the changes, then store the patched tables under the new version
+    version = data_loader.append_changes(delta)
+    aggregates.write_tables(tables, version)
+
+    updated_count = int(removed["listing_id"].isin(added["listing_id"]).sum())
+    return {
+        "version": version,
+        "added": len(added) - updated_count,
+        "updated": updated_count,
+        "removed": len(removed) - updated_count,
+        "listings": int(tables["state_cube"]["count"].sum()),
+    }
+
+
+def compact():
+    """Fold the change log into the listings CSV and return the new dataset version."""
+    old_version = data_loader.dataset_version()
+    version = data_loader.write_listings(data_loader.load_listings())
+
+    # Same listings, so the stored tables carry over to the new version
+    old_path = aggregates.aggregates_path(old_version)
+    if version != old_version and os.path.isdir(old_path):
+        shutil.copytree(old_path, aggregates.aggregates_path(version), dirs_exist_ok=True)
+    return version
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Merge new, updated and removed listings into the dataset.")
+    parser.add_argument("delta", nargs="?", help="CSV or Parquet file of changed listings")
+    parser.add_argument("--compact", action="store_true", help="fold the change log into the listings CSV")
+    args = parser.parse_args()
+    if not args.compact and args.delta is None:
+        parser.error("a delta file or --compact is required")
+
+    start = time.perf_counter()
+    if args.compact:
+        version = compact()
+        print(f"Compacted {data_loader.LISTINGS_FILE} (version {version}) in {time.perf_counter() - start:.2f}s")
+        return
+    summary = refresh(args.delta)
+    print(f"Added {summary['added']:,}, updated {summary['updated']:,} and removed {summary['removed']:,} listings "
+          f"({summary['listings']:,} total, version {summary['version']}) in {time.perf_counter() - start:.2f}s")
+
+
+if __name__ == "__main__":
+    main()
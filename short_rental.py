@@ -1,18 +1,23 @@
 
 import streamlit as st
-import plotly.express as px
-import matplotlib.pyplot as plt
-import pandas as pd
-from PIL import Image
-import seaborn as sns
 import numpy as np
-import altair as alt
-import openpyxl
-import io
 import os 
 import warnings
-import time
-import streamlit.components.v1 as components
+# Plotting libraries are imported inside the sections that draw with them, so
+# they only load once a section is switched on (see import_budget.py)
+import data_loader
+import aggregates
+import charts
+import comparables
+import figures
+import filters
+import geo
+import leaderboard
+import price_stats
+import sql_backend
+import tables
+import timeseries
+import profiling
 
 warnings.filterwarnings('ignore')
 
@@ -24,13 +29,10 @@ st.set_page_config(page_title="New York Short Rental Analysis", page_icon=":char
 
 st.title(":chart_with_upwards_trend: Pillow Palooza NYC Short-Term Rentals")
 
-st.markdown('<style>div.block-container{padding-top:1rem;}</style>', unsafe_allow_html=True)
-
-# Read in data
-os.chdir(r"/mount/src/rental/Data")
-df = pd.read_csv("pillow_final.csv", usecols=['latitude', 'longitude'])
+# Per-section timings, shown in the sidebar when the app is opened with ?admin=1
+profile = profiling.start_run()
 
-st.map(df.head(5000))
+st.markdown('<style>div.block-container{padding-top:1rem;}</style>', unsafe_allow_html=True)
 
 side_bar_text = '''
 I hope you enjoy the following project. 
@@ -46,6 +48,65 @@ side_bar_state = 'collapsed'
 
 st.sidebar.write(side_bar_text)
 
+# Filters apply to the map and every Key Findings chart
+with profile.section('filters'):
+    selection = filters.sidebar(filters.load_options())
+
+with profile.section('map'):
+    # Read in data
+    # Every Key Findings table is precomputed once per dataset version, filtered views are computed on first use
+    aggs = filters.filtered_aggregates(selection)
+    if aggs is None:
+        st.sidebar.warning('No listings match these filters, showing all listings.')
+        aggs = aggregates.load_aggregates()
+    st.sidebar.caption(f'{filters.listing_count(aggs):,} listings')
+
+    # The map shows every listing, clustered on a grid so the number of points stays bounded
+    map_col1, map_col2 = st.columns(2)
+
+    with map_col1:
+        map_level = st.select_slider('Map detail', options=list(geo.ZOOM_LEVELS), value='Neighbourhood')
+
+    with map_col2:
+        map_color = st.radio('Colour by', ['Average price', 'Annual revenue'], horizontal=True)
+
+    map_points = geo.map_points(aggs[aggregates.map_table(map_level)], map_level,
+                                color_by='avg_price' if map_color == 'Average price' else 'annual_revenue')
+    st.map(map_points, size='size', color='color')
+
+def comparables_section():
+    # The index is built once per dataset version, each lookup only visits the grid cells around the point
+    spatial_index = comparables.load_index()
+    comp_col1, comp_col2, comp_col3 = st.columns(3)
+
+    with comp_col1:
+        listing_id = st.number_input('Listing ID', value=int(spatial_index.listings['listing_id'].iloc[0]), step=1,
+                                     key='comparables_listing_id')
+    with comp_col2:
+        k = st.slider('Comparables', min_value=1, max_value=50, value=10, key='comparables_k')
+    with comp_col3:
+        radius = st.select_slider('Radius (metres)', options=[100, 250, 500, 1000, 2000], value=500,
+                                  key='comparables_radius')
+
+    position = spatial_index.position_of(listing_id)
+    if position is None:
+        st.warning(f'No listing with ID {listing_id} and a location.')
+        return
+
+    listing = spatial_index.listings.iloc[position]
+    medians, counts = spatial_index.median_price(listing['latitude'], listing['longitude'], radius)
+    metric_col1, metric_col2 = st.columns(2)
+    metric_col1.metric('Listing price', f"${listing['price']:,.2f}")
+    metric_col2.metric(f'Median price within {radius:,} m', f'${medians[0]:,.2f}',
+                       help=f'{counts[0]:,} listings, including this one')
+    st.dataframe(spatial_index.comparables(listing_id, k))
+    st.caption('Comparables are searched among all listings, regardless of the filters.')
+
+
+if st.toggle('Find comparable listings', key='show_comparables'):
+    with profile.section('comparables'):
+        comparables_section()
+
 # Introduction
 
 intro = '''
@@ -89,23 +150,23 @@ st.markdown(intro_text)
 
 st.markdown('<style>div.block-container{padding-top:1rem;}</style>', unsafe_allow_html=True)
 
-col1, col2, col3 = st.columns(3)
+# The source files are only read when someone asks to see them
+if st.toggle('Show the original datasets', key='show_original_datasets'):
+    with profile.section('original_datasets'):
+        col1, col2, col3 = st.columns(3)
 
-with col1:
-    os.chdir(r"/mount/src/rental/Data")
-    price_df = pd.read_csv("prices.csv", encoding = "ISO-8859-1")
-    st.write(price_df.head())
+        with col1:
+            price_df = data_loader.load_prices()
+            st.write(price_df.head())
 
-with col2:
-    os.chdir(r"/mount/src/rental/Data")
-    room_type_df = pd.read_excel("room_types.xlsx")
-    st.write(room_type_df.head())
+        with col2:
+            room_type_df = data_loader.load_room_types()
+            st.write(room_type_df.head())
+
+        with col3:
+            review_df = data_loader.load_reviews()
+            st.dataframe(review_df.head())
 
-with col3:
-    os.chdir(r"/mount/src/rental/Data")
-    review_df = pd.read_csv("reviews.tsv", delimiter= '\t', encoding = "ISO-8859-1")
-    st.dataframe(review_df.head()) 
-    
 st.markdown('<style>div.block-container{padding-top:1rem;}</style>', unsafe_allow_html=True)
 
 price_text = '''
@@ -163,30 +224,15 @@ st.markdown(part_2_text)
 st.markdown('<style>div.block-container{padding-top:1rem;}</style>', unsafe_allow_html=True)
 
 # Read in data
-os.chdir(r"/mount/src/rental/Data")
-df = pd.read_csv("pillow_final.csv")
-
-del df['Unnamed: 0.2']
-del df['Unnamed: 0']
-del df['Unnamed: 0.1']
-
-# Change the data type of the last_review column to datetime
-#df["last_review"] = pd.to_datetime(df["last_review"])
-
-# Create labels for the price range, label_names
-label_names = ["Budget", "Average", "Expensive", "Extravagant"]
+# Cleaning (junk index columns, price_range and price_per_month) happens once in the loader
+if st.toggle('Show the final dataset', key='show_final_dataset'):
+    with profile.section('final_dataset'):
+        if sql_backend.enabled():
+            df = sql_backend.head()
+        else:
+            df = data_loader.load_listings()
 
-# Create the label ranges, ranges
-ranges = [0, 69, 175, 350, np.inf]
-
-# Insert new column, price_range, into DataFrame
-df["price_range"] = pd.cut(df["price"], bins=ranges, labels=label_names)
-
-df['price_per_month'] =  df["price"] * 365 / 12
-
-#df['price_per_month'] = df['price_per_month']..astype(int)
-
-st.dataframe(df.head()) 
+        st.dataframe(df.head()) 
 
 #buffer = io.StringIO()
 #df.info(buf=buffer)
@@ -222,95 +268,115 @@ with tab3:
    
 st.divider()
 
-data = df.copy()
+st.header('Key Findings')
 
-data['last_review'] = data['last_review'].str.slice(stop=-8)
+st.markdown('<style>div.block-container{padding-top:1rem;}</style>', unsafe_allow_html=True)
 
-data['last_review'] = pd.to_datetime(data['last_review']).dt.date
+st.subheader('Price')
 
-st.header('Key Findings')
+# Below-the-fold sections only compute their charts once they are switched on
+show_price = st.toggle('Show charts', key='show_price')
 
 st.markdown('<style>div.block-container{padding-top:1rem;}</style>', unsafe_allow_html=True)
 
-st.subheader('Price')
+def price_section():
+    from PIL import Image
+    # Summary statistics are computed once per dataset version and feed both the text and the metrics
+    price_stats_table = aggs["price_stats"]
+    stats = price_stats.lookup(price_stats_table)
 
-price_text = '''
+    price_text = f'''
 The dataset provides various statistical measures for analyzing the prices of listings:
 
-The average price of listings is \$141.82, serving as a measure of the central tendency. The
-median price, \$105.00, represents the middle value and gives an indication of the typical price, less affected by
-extreme values. The maximum price observed is \$7,500.0, indicating the highest price among all listings. The mode,
-\$150.00, reveals the most common price category in the dataset.
+The average price of listings is \\${stats["mean"]:,.2f}, serving as a measure of the central tendency. The
+median price, \\${stats["median"]:,.2f}, represents the middle value and gives an indication of the typical price, less affected by
+extreme values. The maximum price observed is \\${stats["max"]:,.1f}, indicating the highest price among all listings. The mode,
+\\${stats["mode"]:,.2f}, reveals the most common price category in the dataset.
 
-The price range is \$7,490.0, representing the difference between the maximum and minimum prices and indicating the
-spread of prices across the dataset. The interquartile range (IQR) for all data is 106.00, capturing the range within
-which the central 50% of prices fall. The standard deviation, 147.35, reflects a relatively large spread of prices from
+The price range is \\${stats["range"]:,.1f}, representing the difference between the maximum and minimum prices and indicating the
+spread of prices across the dataset. The interquartile range (IQR) for all data is {stats["iqr"]:,.2f}, capturing the range within
+which the central 50% of prices fall. The standard deviation, {stats["std"]:,.2f}, reflects a relatively large spread of prices from
 the mean.
 
-Additionally, the dataset includes 1326 outliers, which are values significantly deviating from the rest of the data.
+Additionally, the dataset includes {stats["outliers"]:.0f} outliers, which are values significantly deviating from the rest of the data.
 These outliers may represent unusual or extreme price points deserving further examination.
 '''
-st.markdown(price_text)
+    st.markdown(price_text)
 
-st.markdown('<style>div.block-container{padding-top:1rem;}</style>', unsafe_allow_html=True)
+    os.chdir(r"/mount/src/rental/images")
+    price_distribution_image = Image.open('price_distribution.png')
 
-os.chdir(r"/mount/src/rental/images")
-price_distribution_image = Image.open('price_distribution.png')
+    price_mean = np.round(stats["mean"], 2)
+    price_min = np.round(stats["min"], 2)
+    price_max = np.round(stats["max"], 2)
 
-price_mean = np.round(data["price"].mean(), 2)
-price_min = np.round(data["price"].min(), 2)
-price_max = np.round(data["price"].max(), 2)
+    price_col1, price_col2 = st.columns(2)
 
-#Outlier detection
-price_q1 = data["price"].quantile(0.25)
-price_q3 = data["price"].quantile(0.75)
-iqr = price_q3 - price_q1
-all_data_outliers = data[(data["price"] < (price_q1 - 1.5 * iqr)) | (data["price"] > (price_q3 + 1.5 * iqr))]
+    with price_col1:
+        st.image(price_distribution_image)
 
-price_col1, price_col2 = st.columns(2)
+    with price_col2:    
+        st.write('Price Mean: $', price_mean)
+        st.write('Price Min: $', price_min)
+        st.write('Price Max: $', price_max)
+        st.write('Price Range: $', price_max - price_min)
+        st.write('All Data Interquartile range: ', stats["iqr"])
+        st.write('All Data Standard deviation: ', np.round(stats["std"], 2))
+        st.write('Number of outliers: ', int(stats["outliers"]))
 
-with price_col1:
-    st.image(price_distribution_image)
+    with st.expander("Price Statistics By Borough & Room Type"):
+        st.write(price_stats_table[price_stats_table["group_by"] != "all"].round(2))
 
-with price_col2:    
-    st.write('Price Mean: $', price_mean)
-    st.write('Price Min: $', price_min)
-    st.write('Price Max: $', price_max)
-    st.write('Price Range: $', price_max - price_min)
-    st.write('All Data Interquartile range: ', data["price"].quantile(0.75) - data["price"].quantile(0.25))
-    st.write('All Data Standard deviation: ', np.round(data["price"].std(), 2))
-    st.write('Number of outliers: ', all_data_outliers.shape[0])
-    
-st.divider()
 
-# Calculate the correlation coefficient
-correlation_coefficient = data['booked_days_365'].corr(data['price'])
+if show_price:
+    with profile.section('price'):
+        price_section()
+
+st.divider()
 
 st.subheader('Booked Days 365 & Price Correlation')
 
-st.write(f'Booked Days and Price Correlation: The correlation coefficient between Booked_Days_365 and Price is {correlation_coefficient}')
+show_correlation = st.toggle('Show charts', key='show_correlation')
+
+def correlation_section():
+    # Calculate the correlation coefficient
+    correlation_coefficient = aggs["scatter_correlation"]["correlation"].iloc[0]
+
+    st.write(f'Booked Days and Price Correlation: The correlation coefficient between Booked_Days_365 and Price is {correlation_coefficient}')
 
-correlation_coefficient_text = '''
+    correlation_coefficient_text = '''
 This correlation coefficient suggests a weak negative relationship between the length of stay and the price of the
 listings in the dataset.
 '''
 
-st.write(correlation_coefficient_text)
+    st.write(correlation_coefficient_text)
+
+    # Binned and sampled views are precomputed, all listings are only sent on request
+    scatter_view = st.radio('Scatter view', ['Binned', 'Sample', 'All listings'], horizontal=True,
+                            help='Binned groups listings into booked days and price cells, Sample shows a borough-stratified '
+                                 f'sample of up to {aggregates.SCATTER_SAMPLE_SIZE:,} listings, All listings sends every point.')
+
+    # Charts are built and serialised once per dataset version, view and theme
+    def build():
+        if scatter_view == 'Binned':
+            return charts.scatter_bins(aggs["scatter_bins"])
+        if scatter_view == 'Sample':
+            return charts.scatter_points(aggs["scatter_sample"])
+        return charts.scatter_points(filters.listings_for(aggs, ['booked_days_365', 'price', 'borough']))
 
-source = data
+    figures.altair_chart(figures.figure_key(aggs, f'scatter/{scatter_view}'), build)
 
-chart = alt.Chart(source).mark_circle(size=20).encode(
-    x='booked_days_365',
-    y='price',
-    color='borough'
-).interactive()
 
-st.altair_chart(chart, theme=None, use_container_width=True)
+if show_correlation:
+    with profile.section('correlation'):
+        correlation_section()
 
 st.divider()
 
 st.subheader('Room Types')
 
+show_room_types = st.toggle('Show charts', key='show_room_types')
+
 room_types_text1 = '''
 The analysis of room types reveals interesting patterns and preferences among Airbnb listings. The three main
 categories, namely Entire Home/Apt, Private Room, and Shared Room, exhibit distinct characteristics in terms of the
@@ -323,31 +389,31 @@ with an average price of \$54.00.
 '''
 st.write(room_types_text1)
 
-room_types_counts = data.groupby("room_type", as_index = False)["listing_id"].count()
+def room_types_section():
+    room_types_counts = aggs["room_types_counts"]
 
-room_types_counts = room_types_counts.rename(columns={'listing_id': 'total_listings'})
+    room_types_avg_price = aggs["room_types_avg_price"]
 
-room_types_avg_price = data.groupby("room_type")["price"].mean().reset_index()
+    room_col_left, room_col_right = st.columns(2)
 
-room_types_avg_price = room_types_avg_price.rename(columns={'price': 'avg_price'})
+    with room_col_left:
+        figures.plotly_chart(figures.figure_key(aggs, 'room_types_counts'), lambda: charts.room_types_counts(room_types_counts))
 
-room_col_left, room_col_right = st.columns(2)
+        with st.expander("View Data"):
+            tables.gradient_table(room_types_counts, key='room_types_counts_page')
 
-with room_col_left:
-    fig = px.bar(room_types_counts, x = "room_type", y = "total_listings", text = ['{:,.0f}'.format(x) for x in room_types_counts["total_listings"]], template = "seaborn", title='Total Listings By Room Type')
-    st.plotly_chart(fig, use_container_width=True)
 
-    with st.expander("View Data"):
-        st.write(room_types_counts.style.background_gradient(cmap="Blues"))
-        
+    with room_col_right:
+        figures.plotly_chart(figures.figure_key(aggs, 'room_types_avg_price'), lambda: charts.room_types_avg_price(room_types_avg_price))
 
-with room_col_right:
-    fig = px.bar(room_types_avg_price, x = "room_type", y = "avg_price", text = ['${:,.2f}'.format(x) for x in room_types_avg_price["avg_price"]], template = "seaborn", title='Average Price By Room Type')
-    st.plotly_chart(fig, use_container_width=True)
+        with st.expander("View Data"):
+            tables.gradient_table(room_types_avg_price, key='room_types_avg_price_page')
+
+
+if show_room_types:
+    with profile.section('room_types'):
+        room_types_section()
 
-    with st.expander("View Data"):
-        st.write(room_types_avg_price.style.background_gradient(cmap="Blues"))
-        
 st.markdown('<style>div.block-container{padding-top:1rem;}</style>', unsafe_allow_html=True)
         
 room_types_text2 = '''
@@ -367,24 +433,30 @@ cater to the preferences and needs of their target audience.
 '''
 st.write(room_types_text2)
         
-mean_booked_days_over_time = data.groupby(['last_review', 'room_type'])['booked_days_365'].sum().reset_index()
+def room_types_over_time_section():
+    # Day to quarter totals are precomputed, Auto picks the resolution from the date range
+    resolution = st.radio('Resolution', ['Auto'] + list(timeseries.GRANULARITIES), horizontal=True, key='room_types_resolution')
+    mean_booked_days_over_time, granularity = timeseries.series(aggs[timeseries.rollup_name('room_type')], resolution)
 
-st.markdown('<style>div.block-container{padding-top:1rem;}</style>', unsafe_allow_html=True)
+    st.markdown('<style>div.block-container{padding-top:1rem;}</style>', unsafe_allow_html=True)
 
-chart2 = alt.Chart(mean_booked_days_over_time, height=450).mark_line(strokeWidth=1).encode(
-  x=alt.X('last_review:T', title='last review date'),
-  y=alt.Y('booked_days_365:Q', title='total booked days'),
-  color=alt.Color("room_type")
-).properties(title="Total Booked Days By Room Type Over Time")
-st.altair_chart(chart2, theme=None, use_container_width=True)
+    figures.altair_chart(figures.figure_key(aggs, f'booked_days_by_room_type/{granularity}'),
+                         lambda: charts.room_types_over_time(mean_booked_days_over_time, granularity))
+
+    with st.expander("View Data"):
+        tables.gradient_table(mean_booked_days_over_time, key='mean_booked_days_over_time_page')
 
-with st.expander("View Data"):
-    st.write(mean_booked_days_over_time.style.background_gradient(cmap="Blues"))
+
+if show_room_types:
+    with profile.section('room_types_over_time'):
+        room_types_over_time_section()
 
 st.divider()
 
 st.subheader('Boroughs & neighbourhoods')
 
+show_boroughs = st.toggle('Show charts', key='show_boroughs')
+
 boroughs_text = '''
 Brooklyn stands out as the leading borough in terms of the number of listings, with a total of 10,460 listings,
 accounting for 41.50% of the dataset. With an average monthly price of \$3,710.00, these listings generate a
@@ -404,54 +476,50 @@ The top 10 neighbourhoods by annual revenue demonstrate high average booked days
 
 st.write(boroughs_text)
 
-pie_data_listings = data.groupby('borough')['listing_id'].count().reset_index().sort_values('listing_id', ascending=False)
+def boroughs_section():
+    pie_data_listings = aggs["pie_data_listings"]
 
-data['annual_revenue'] = data['price'] * data['booked_days_365']
+    pie_data_yearly_reveneue = aggs["pie_data_yearly_reveneue"]
 
-pie_data_yearly_reveneue = data.groupby('borough')['annual_revenue'].sum().reset_index().sort_values('annual_revenue', ascending=False)
+    boroughs_neighbourhoods_left, boroughs_neighbourhoods_right = st.columns(2)
 
-boroughs_neighbourhoods_left, boroughs_neighbourhoods_right = st.columns(2)
+    neighbourhoods = leaderboard.Leaderboard(aggs["neighbourhood_leaderboard"])
 
-neighborhoods = data.groupby('neighbourhood').agg({'annual_revenue' : 'sum',
-                                                   'price' : 'mean',
-                                                   'listing_id' : 'count',
-                                                   'booked_days_365' : 'mean'}).reset_index().sort_values('booked_days_365', ascending=False)
+    pie_data_col1, pie_data_col2, pie_data_col3 = st.columns(3)
 
-neighborhoods = neighborhoods.rename(columns={'price': 'avg_price', 'listing_id': 'total_listings', 'booked_days_365': 'avg_booked_days'})
+    with pie_data_col1:
+        figures.plotly_chart(figures.figure_key(aggs, 'pie_data_listings'), lambda: charts.listings_by_borough(pie_data_listings))
 
-neighborhoods_top_10 = neighborhoods.sort_values('annual_revenue', ascending=False)
+        with st.expander("View Data"):
+            tables.gradient_table(pie_data_listings, key='pie_data_listings_page')
 
-neighborhoods_top_10 = neighborhoods_top_10.head(10)
+    with pie_data_col2:
+        figures.plotly_chart(figures.figure_key(aggs, 'pie_data_yearly_reveneue'), lambda: charts.revenue_by_borough(pie_data_yearly_reveneue))
 
-pie_data_col1, pie_data_col2, pie_data_col3 = st.columns(3)
+        with st.expander("View Data"):
+            tables.gradient_table(pie_data_yearly_reveneue, key='pie_data_yearly_reveneue_page')
 
-with pie_data_col1:
-    fig = px.pie(pie_data_listings, values = "listing_id", names = "borough", hole = 0.5, title="% of Listings by Borough")
-    fig.update_traces(text = pie_data_listings["borough"], textposition = "outside")
-    st.plotly_chart(fig, use_container_width=True)
+    with pie_data_col3:
+        # Any ranking of the leaderboard is a partial selection over the stored table
+        rank_by = st.selectbox('Rank neighbourhoods by', list(leaderboard.METRICS))
+        rank_borough = st.selectbox('In', ['All boroughs'] + aggregates.BOROUGHS)
+        neighborhoods_top_10 = neighbourhoods.top(leaderboard.METRICS[rank_by], 10, None if rank_borough == 'All boroughs' else rank_borough)
+        figures.plotly_chart(figures.figure_key(aggs, f'neighbourhoods_top_10/{rank_by}/{rank_borough}'), lambda: charts.top_neighbourhoods(neighborhoods_top_10, rank_by))
 
-    with st.expander("View Data"):
-        st.write(pie_data_listings.style.background_gradient(cmap="Blues"))
-        
-with pie_data_col2:
-    fig = px.pie(pie_data_yearly_reveneue, values = "annual_revenue", names = "borough", hole = 0.5, title="% of Annual Revenue by Borough")
-    fig.update_traces(text = pie_data_yearly_reveneue["borough"], textposition = "outside")
-    st.plotly_chart(fig,use_container_width=True)
+        with st.expander("View Data"):
+            tables.gradient_table(neighborhoods_top_10, key='neighborhoods_top_10_page')
 
-    with st.expander("View Data"):
-        st.write(pie_data_yearly_reveneue.style.background_gradient(cmap="Blues"))      
 
-with pie_data_col3:
-    fig = px.bar(neighborhoods_top_10, x = "neighbourhood", y = "avg_booked_days", text = ['{:,.0f} Days'.format(x) for x in neighborhoods_top_10["avg_booked_days"]], template = "seaborn", title="Top 10 Neighbourhoods by Revenue")
-    st.plotly_chart(fig, use_container_width=True)
+if show_boroughs:
+    with profile.section('boroughs'):
+        boroughs_section()
 
-    with st.expander("View Data"):
-        st.write(neighborhoods_top_10.style.background_gradient(cmap="Blues"))
-  
 st.divider()
 
 st.subheader('Price Ranges')
 
+show_price_ranges = st.toggle('Show charts', key='show_price_ranges')
+
 booked_days_365_text1 = '''
 The analysis of the review dates as an approximation for bookings throughout the year reveals interesting insights.
 The "Budget" price range category emerges as the most popular category overall, consistently attracting a high
@@ -464,20 +532,23 @@ celebrate the New Year in iconic locations like Times Square.
 '''
 st.markdown(booked_days_365_text1)
 
-ranges_days_over_time = data.groupby(['last_review', 'price_range'])['booked_days_365'].sum().reset_index()
+def price_ranges_over_time_section():
+    resolution = st.radio('Resolution', ['Auto'] + list(timeseries.GRANULARITIES), horizontal=True, key='price_ranges_resolution')
+    ranges_days_over_time, granularity = timeseries.series(aggs[timeseries.rollup_name('price_range')], resolution)
 
-st.markdown('<style>div.block-container{padding-top:1rem;}</style>', unsafe_allow_html=True)
+    st.markdown('<style>div.block-container{padding-top:1rem;}</style>', unsafe_allow_html=True)
 
-chart3 = alt.Chart(ranges_days_over_time, height=450).mark_line(strokeWidth=1).encode(
-  x=alt.X('last_review:T', title='last review date'),
-  y=alt.Y('booked_days_365:Q', title='total booked days'),
-  color=alt.Color('price_range', scale={"range": ["red", "gold", 'blue', 'orange']})
-).properties(title="Price Range By Total Booked Days")
-st.altair_chart(chart3, theme=None, use_container_width=True)
+    figures.altair_chart(figures.figure_key(aggs, f'booked_days_by_price_range/{granularity}'),
+                         lambda: charts.price_ranges_over_time(ranges_days_over_time, granularity))
+
+    with st.expander("View Data"):
+        tables.gradient_table(ranges_days_over_time, key='ranges_days_over_time_page')
+
+
+if show_price_ranges:
+    with profile.section('price_ranges_over_time'):
+        price_ranges_over_time_section()
 
-with st.expander("View Data"):
-    st.write(ranges_days_over_time.style.background_gradient(cmap="Blues"))
-    
 st.markdown('<style>div.block-container{padding-top:1rem;}</style>', unsafe_allow_html=True)
 
 price_ranges_text = '''
@@ -491,34 +562,36 @@ frame in which bookings tend to peak.
 '''
 st.write(price_ranges_text)
 
-price_ranges_by_listing_count = data.groupby("price_range", as_index = False)["listing_id"].count().sort_values(by='listing_id', ascending=False)
+def price_ranges_section():
+    price_ranges_by_listing_count = aggs["price_ranges_by_listing_count"]
 
-price_ranges_by_listing_count = price_ranges_by_listing_count.rename(columns = {'listing_id' : 'total_listings'})
+    price_ranges_by_price = aggs["price_ranges_by_price"]
 
-price_ranges_by_price = data.groupby(by = ["price_range"], as_index = False)["booked_days_365"].mean().sort_values(by='booked_days_365', ascending=False)
+    price_col_left, price_col_right = st.columns(2)
 
-price_ranges_by_price = price_ranges_by_price.rename(columns = {'booked_days_365' : 'total_booked_days'})
+    with price_col_left:
+        figures.plotly_chart(figures.figure_key(aggs, 'price_ranges_by_listing_count'), lambda: charts.price_ranges_by_listing_count(price_ranges_by_listing_count))
 
-price_col_left, price_col_right = st.columns(2)
+        with st.expander("View Data"):
+            tables.gradient_table(price_ranges_by_listing_count, key='price_ranges_by_listing_count_page')
 
-with price_col_left:
-    fig = px.bar(price_ranges_by_listing_count, x = "price_range", y = "total_listings", text = ['{:,.0f}Listings'.format(x) for x in price_ranges_by_listing_count["total_listings"]], template = "seaborn", title='Total Listings By Price Range')
-    st.plotly_chart(fig, use_container_width=True)
+    with price_col_right:
+        figures.plotly_chart(figures.figure_key(aggs, 'price_ranges_by_price'), lambda: charts.price_ranges_by_price(price_ranges_by_price))
+
+        with st.expander("View Data"):
+            tables.gradient_table(price_ranges_by_price, key='price_ranges_by_price_page')
+
+
+if show_price_ranges:
+    with profile.section('price_ranges'):
+        price_ranges_section()
 
-    with st.expander("View Data"):
-        st.write(price_ranges_by_listing_count.style.background_gradient(cmap="Blues"))
-        
-with price_col_right:
-    fig = px.bar(price_ranges_by_price, x = "price_range", y = "total_booked_days", text = ['{:,.0f}Days'.format(x) for x in price_ranges_by_price["total_booked_days"]], template = "seaborn", title='Avg Booked Days By Price Range')
-    st.plotly_chart(fig, use_container_width=True)
-    
-    with st.expander("View Data"):
-        st.write(price_ranges_by_price.style.background_gradient(cmap="Blues"))
-    
 st.divider()
 
 st.subheader('Reviews')
 
+show_reviews = st.toggle('Show charts', key='show_reviews')
+
 reviews_text = '''
 Brooklyn takes the lead in terms of total reviews, particularly in the "Average" price range, with a substantial count of
 254,489 reviews. Following closely behind is the "Budget" price range, which receives 112,421 reviews.
@@ -531,72 +604,31 @@ behind is the "Average" price range, with 62,943 reviews, making it a close cont
 '''
 st.write(reviews_text)
 
-# Brooklyn Data
-brooklyn_data = data[data['borough'] =='Brooklyn']
-brooklyn_data = brooklyn_data.groupby('price_range')["number_of_reviews"].sum().reset_index().sort_values('number_of_reviews', ascending=False)
+def reviews_section():
+    # Every borough tab is a slice of one (price_range, borough) cube
+    reviews_cube = aggregates.Cube(aggs["reviews_cube"], ["price_range", "borough"])
 
-# Bronx Data
-bronx_data = data[data['borough'] =='Bronx']
-bronx_data = bronx_data.groupby('price_range')["number_of_reviews"].sum().reset_index().sort_values('number_of_reviews', ascending=False)
+    all_boroughs = aggs["all_boroughs"]
 
-# Manhattan Data
-Manhattan_data = data[data['borough'] =='Manhattan']
-Manhattan_data = Manhattan_data.groupby('price_range')["number_of_reviews"].sum().reset_index().sort_values('number_of_reviews', ascending=False)
+    figures.plotly_chart(figures.figure_key(aggs, 'all_boroughs'), lambda: charts.reviews_by_borough(all_boroughs))
+    with st.expander("View Data"):
+        tables.gradient_table(all_boroughs, key='all_boroughs_page')
 
-# Queens Data
-Queens_data = data[data['borough'] =='Queens']
-Queens_data = Queens_data.groupby('price_range')["number_of_reviews"].sum().reset_index().sort_values('number_of_reviews', ascending=False)
+    borough_tabs = st.tabs(aggregates.BOROUGHS)
 
-# Staten Island Data
-staten_data = data[data['borough'] =='Staten Island']
-staten_data = staten_data.groupby('price_range')["number_of_reviews"].sum().reset_index().sort_values('number_of_reviews', ascending=False)
+    for borough, borough_tab in zip(aggregates.BOROUGHS, borough_tabs):
+        with borough_tab:
+            borough_data = aggregates.borough_reviews(reviews_cube, borough)
+            figures.plotly_chart(figures.figure_key(aggs, f'reviews/{borough}'), lambda: charts.borough_reviews(borough_data))
 
-all_boroughs = data.groupby(['price_range', 'borough'])['number_of_reviews'].sum().reset_index().sort_values('number_of_reviews', ascending=True)
+            with st.expander("View Data"):
+                tables.gradient_table(borough_data, key=f'{borough}_reviews_page')
 
-all_boroughs = all_boroughs.rename(columns={'number_of_reviews':'total_reviews'})
-        
-fig = px.bar(all_boroughs.dropna(), y = "price_range", x = "total_reviews", text = ['{:,.0f}'.format(x) for x in all_boroughs["total_reviews"]], template = "seaborn", color='borough')
-st.plotly_chart(fig, use_container_width=True)
-with st.expander("View Data"):
-    st.write(all_boroughs.style.background_gradient(cmap="Blues"))
 
-borough_tab1, borough_tab2, borough_tab3, borough_tab4, borough_tab5 = st.tabs(['Brooklyn', 'Bronx', 'Manhattan', 'Queens', 'Staten Island'])
+if show_reviews:
+    with profile.section('reviews'):
+        reviews_section()
 
-with borough_tab1:
-    fig = px.bar(brooklyn_data.dropna(), x = "price_range", y = "number_of_reviews", text = ['{:,.0f}'.format(x) for x in brooklyn_data["number_of_reviews"]], template = "seaborn")
-    st.plotly_chart(fig, use_container_width=True)
-    
-    with st.expander("View Data"):
-        st.write(brooklyn_data.style.background_gradient(cmap="Blues"))
-        
-with borough_tab2:
-    fig = px.bar(bronx_data.dropna(), x = "price_range", y = "number_of_reviews", text = ['{:,.0f}'.format(x) for x in bronx_data["number_of_reviews"]], template = "seaborn")
-    st.plotly_chart(fig, use_container_width=True)
-    
-    with st.expander("View Data"):
-        st.write(bronx_data.style.background_gradient(cmap="Blues"))
-        
-with borough_tab3:
-    fig = px.bar(Manhattan_data.dropna(), x = "price_range", y = "number_of_reviews", text = ['{:,.0f}'.format(x) for x in Manhattan_data["number_of_reviews"]], template = "seaborn")
-    st.plotly_chart(fig, use_container_width=True)
-    
-    with st.expander("View Data"):
-        st.write(Manhattan_data.style.background_gradient(cmap="Blues"))
-        
-with borough_tab4:
-    fig = px.bar(Queens_data.dropna(), x = "price_range", y = "number_of_reviews", text = ['{:,.0f}'.format(x) for x in Queens_data["number_of_reviews"]], template = "seaborn")
-    st.plotly_chart(fig, use_container_width=True)
-    
-    with st.expander("View Data"):
-        st.write(Queens_data.style.background_gradient(cmap="Blues"))
-        
-with borough_tab5:
-    fig = px.bar(staten_data.dropna(), x = "price_range", y = "number_of_reviews", text = ['{:,.0f}'.format(x) for x in staten_data["number_of_reviews"]], template = "seaborn")
-    st.plotly_chart(fig, use_container_width=True)
-    
-    with st.expander("View Data"):
-        st.write(staten_data.style.background_gradient(cmap="Blues"))
-            
 st.divider()
 
 st.header('Recommendations')
@@ -692,6 +724,9 @@ with contact_col2:
 
     local_css(style_file)
 
+profile.finish()
+profiling.admin_panel(profile)
+
 
 
     
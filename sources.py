@@ -0,0 +1,59 @@
+"""
+Reading and cleaning of the three source files.
+
+prices.csv, room_types.xlsx and reviews.tsv are parsed here for both ETL
+paths: etl.py streams prices.csv through parse_prices chunk by chunk, and
+ingest.py runs the same parsers in worker processes. Room types and reviews
+become lookups indexed on listing_id, ready for etl.hash_join.
+"""
+
+import pandas as pd
+
+ROOM_TYPES = ["entire home/apt", "private room", "shared room"]
+
+PRICES_READ_ARGS = {"encoding": "ISO-8859-1", "dtype": {"price": str, "nbhood_full": str}}
+REVIEWS_READ_ARGS = {"delimiter": "\t", "encoding": "ISO-8859-1"}
+
+
+def parse_prices(chunk):
+    """Vectorised cleaning of one chunk of prices.csv."""
+    price = pd.to_numeric(chunk["price"].str.partition(" ")[0], errors="coerce").astype("float64")
+    nbhood = chunk["nbhood_full"].str.partition(", ")
+
+    prices = pd.DataFrame({
+        "listing_id": chunk["listing_id"].to_numpy(),
+        "price": price.to_numpy(),
+        "borough": nbhood[0].to_numpy(),
+        "neighbourhood": nbhood[2].to_numpy(),
+    })
+
+    # Listings with a price of 0 were removed
+    prices = prices[prices["price"] > 0]
+    return prices.assign(price_per_month=prices["price"] * 365 / 12)
+
+
+def parse_room_types(room_types):
+    room_type = room_types["room_type"].str.lower().astype(pd.CategoricalDtype(ROOM_TYPES))
+    return pd.DataFrame({"description": room_types["description"].astype("string").to_numpy(),
+                         "room_type": room_type.to_numpy()},
+                        index=pd.Index(room_types["listing_id"], name="listing_id"))
+
+
+def parse_reviews(reviews):
+    last_review = pd.to_datetime(reviews["last_review"], format="%B %d %Y", errors="coerce")
+    return pd.DataFrame({"host_name": reviews["host_name"].astype("string").to_numpy(),
+                         "last_review": last_review.to_numpy()},
+                        index=pd.Index(reviews["listing_id"], name="listing_id"))
+
+
+def build_lookup(frame):
+    """Deduplicate on listing_id so the index can be used as a hash join."""
+    return frame[~frame.index.duplicated(keep="last")]
+
+
+def parse_room_types_file(path):
+    return build_lookup(parse_room_types(pd.read_excel(path)))
+
+
+def parse_reviews_file(path):
+    return build_lookup(parse_reviews(pd.read_csv(path, **REVIEWS_READ_ARGS)))
@@ -0,0 +1,268 @@
+"""
+Optional SQLite backend for the Key Findings aggregates.
+
+Set RENTAL_BACKEND=sqlite to use it. The listings CSV is then loaded, chunk by
+chunk, into Data/listings.sqlite with indexes on borough, neighbourhood,
+room_type, price_range and last_review, and every aggregate section is
+computed by queries against that file instead of from a frame of the whole
+dataset:
+
+  * the Room Types, Boroughs, Price Ranges, time series and Reviews tables
+    roll up from the two state cubes, which are plain GROUP BY queries;
+  * the map clusters are a GROUP BY over grid cells;
+  * the price statistics and the scatter views need every value, so they
+    read just the two or three columns involved.
+
+The sidebar filters become WHERE clauses on the indexed columns. Nothing holds
+the full dataset in memory, and every worker process reads the same file.
+The database is rebuilt when the listings CSV or its change log changes;
+build it ahead of a deploy with:
+
+    python sql_backend.py
+"""
+
+import os
+import sqlite3
+import threading
+
+import pandas as pd
+
+import aggregates
+import data_loader
+import geo
+
+DATABASE_FILE = "listings.sqlite"
+
+INDEXED_COLUMNS = ["borough", "neighbourhood", "room_type", "price_range", "last_review"]
+
+# Columns stored in the database, in table order
+COLUMNS = ["listing_id", "price", "borough", "neighbourhood", "room_type", "price_range", "last_review",
+           "booked_days_365", "number_of_reviews", "annual_revenue", "price_per_month", "minimum_nights",
+           "reviews_per_month", "availability_365", "latitude", "longitude", "description", "host_name"]
+
+LOAD_CHUNKSIZE = 100_000
+
+_local = threading.local()
+_lock = threading.Lock()
+_built = {}
+
+
+def enabled():
+    return os.environ.get("RENTAL_BACKEND") == "sqlite"
+
+
+def database_path():
+    return data_loader.data_path(DATABASE_FILE)
+
+
+def stored_version(path):
+    if not os.path.exists(path):
+        return None
+    with sqlite3.connect(path) as conn:
+        try:
+            return conn.execute("SELECT value FROM meta WHERE key = 'version'").fetchone()[0]
+        except sqlite3.Error:
+            return None
+
+
+def _sql_frame(chunk):
+    """A typed listings chunk as plain columns sqlite3 can store."""
+    frame = pd.DataFrame({column: chunk[column] for column in COLUMNS if column in chunk})
+    for column in frame.columns:
+        if isinstance(frame[column].dtype, pd.CategoricalDtype) or pd.api.types.is_string_dtype(frame[column]):
+            frame[column] = frame[column].astype(object).where(frame[column].notna(), None)
+    frame["last_review"] = frame["last_review"].dt.strftime("%Y-%m-%d")
+    return frame
+
+
+def build_database(path, version, chunksize=LOAD_CHUNKSIZE):
+    """Load the listings CSV into a new database file and swap it in."""
+    tmp_path = path + ".tmp"
+    if os.path.exists(tmp_path):
+        os.remove(tmp_path)
+
+    conn = sqlite3.connect(tmp_path)
+    try:
+        for chunk in data_loader.read_listings_chunks(data_loader.data_path(data_loader.LISTINGS_FILE), chunksize):
+            _sql_frame(chunk).to_sql("listings", conn, if_exists="append", index=False)
+        for column in INDEXED_COLUMNS:
+            conn.execute(f"CREATE INDEX idx_listings_{column} ON listings ({column})")
+        conn.execute("CREATE TABLE meta (key TEXT PRIMARY KEY, value TEXT)")
+        conn.execute("INSERT INTO meta VALUES ('version', ?)", (version,))
+        conn.commit()
+    except BaseException:
+        conn.close()
+        os.remove(tmp_path)
+        raise
+    conn.close()
+    os.replace(tmp_path, path)
+
+
+def ensure_database():
+    """Build the database if it is missing or was loaded from another listings file."""
+    path = database_path()
+    version = data_loader.dataset_version()
+    with _lock:
+        if _built.get(path) != version:
+            if stored_version(path) != version:
+                build_database(path, version)
+            _built[path] = version
+    return path, version
+
+
+def connection():
+    """A read-only connection for this thread to the current database."""
+    path, version = ensure_database()
+    if getattr(_local, "version", None) != version:
+        if getattr(_local, "conn", None) is not None:
+            _local.conn.close()
+        _local.conn = sqlite3.connect(f"file:{path}?mode=ro", uri=True)
+        _local.version = version
+    return _local.conn
+
+
+def where_clause(selection=None):
+    """SQL condition and parameters for a sidebar selection, see filters.sidebar."""
+    clauses, params = [], []
+    for column, values in (selection or {}).items():
+        if not values:
+            continue
+        if column == "last_review":
+            clauses.append("last_review BETWEEN ? AND ?")
+            params += [values[0].isoformat(), values[1].isoformat()]
+        else:
+            clauses.append(f"{column} IN ({', '.join('?' * len(values))})")
+            params += [str(value) for value in values]
+    return " AND ".join(clauses) or "1", params
+
+
+def query(sql, params=()):
+    return pd.read_sql_query(sql, connection(), params=list(params))
+
+
+def _typed(table):
+    """Give query results the dtypes of the pandas builders."""
+    for column in ["borough", "neighbourhood", "room_type"]:
+        if column in table:
+            table[column] = table[column].astype("category")
+    if "price_range" in table:
+        table["price_range"] = pd.Categorical(table["price_range"], categories=data_loader.PRICE_LABELS, ordered=True)
+    if "last_review" in table:
+        table["last_review"] = pd.to_datetime(table["last_review"])
+    return table
+
+
+def columns(names=None, selection=None):
+    """The matching listings, all columns or just names."""
+    where, params = where_clause(selection)
+    return _typed(query(f"SELECT {', '.join(names) if names else '*'} FROM listings WHERE {where}", params))
+
+
+def head(rows=5):
+    return _typed(query("SELECT * FROM listings LIMIT ?", [rows]))
+
+
+def listing_count(selection=None):
+    where, params = where_clause(selection)
+    return int(connection().execute(f"SELECT COUNT(*) FROM listings WHERE {where}", params).fetchone()[0])
+
+
+def state_tables(selection=None):
+    """The state_cube and state_daily tables of aggregates.build_state, by GROUP BY."""
+    where, params = where_clause(selection)
+    dims = ", ".join(aggregates.STATE_DIMS)
+    sums = ", ".join(f"SUM({m}) AS {m}" for m in aggregates.STATE_MEASURES)
+    state_cube = query(f"SELECT {dims}, {sums}, COUNT(*) AS count FROM listings WHERE {where} GROUP BY {dims}", params)
+
+    dims = ", ".join(aggregates.DAILY_DIMS)
+    sums = ", ".join(f"SUM({m}) AS {m}" for m in aggregates.DAILY_MEASURES)
+    state_daily = query(f"SELECT {dims}, {sums}, COUNT(*) AS count FROM listings WHERE {where} GROUP BY {dims}", params)
+    return {"state_cube": _typed(state_cube), "state_daily": _typed(state_daily)}
+
+
+def _floor(expression):
+    # SQLite only has FLOOR when built with the math functions
+    return f"(CAST({expression} AS INTEGER) - ({expression} < CAST({expression} AS INTEGER)))"
+
+
+def map_tables(selection=None):
+    """Grid clusters per zoom level, as geo.grid_clusters computes them."""
+    where, params = where_clause(selection)
+    tables = {}
+    for level, cell_size in geo.ZOOM_LEVELS.items():
+        row, col = _floor(f"latitude / {cell_size!r}"), _floor(f"longitude / {cell_size!r}")
+        clusters = query(f"""
+            SELECT AVG(latitude) AS latitude, AVG(longitude) AS longitude, COUNT(*) AS listings,
+                   AVG(price) AS avg_price, SUM(annual_revenue) AS annual_revenue
+            FROM listings
+            WHERE latitude IS NOT NULL AND longitude IS NOT NULL AND {where}
+            GROUP BY {row}, {col}
+            ORDER BY {row}, {col}""", params)
+        tables[aggregates.map_table(level)] = clusters
+    return tables
+
+
+def build_section(section_name, selection=None):
+    """The tables of one aggregates section, computed from the database."""
+    if section_name == "map":
+        return map_tables(selection)
+    if section_name == "price":
+        return aggregates.build_price(columns(["price", "borough", "room_type"], selection))
+    if section_name == "scatter":
+        return aggregates.build_scatter(columns(["booked_days_365", "price", "borough"], selection))
+    if section_name == "map_cells":
+        return aggregates.build_map_cells(columns(["latitude", "longitude", "price", "annual_revenue"], selection))
+    if section_name == "price_counts":
+        return aggregates.build_price_counts(columns(["price", "borough", "room_type"], selection))
+
+    state = state_tables(selection)
+    if section_name == "state":
+        return state
+    return aggregates.derive_from_state(state["state_cube"], state["state_daily"])
+
+
+class SqlIndex:
+    """The sidebar options, read from the database instead of a filters.FilterIndex."""
+
+    def __init__(self):
+        self.values = {column: query(f"SELECT DISTINCT {column} FROM listings WHERE {column} IS NOT NULL "
+                                     f"ORDER BY {column}")[column].tolist()
+                       for column in ["borough", "neighbourhood", "room_type"]}
+        self.values["price_range"] = list(data_loader.PRICE_LABELS)
+
+        pairs = query("SELECT DISTINCT borough, neighbourhood FROM listings "
+                      "WHERE borough IS NOT NULL AND neighbourhood IS NOT NULL ORDER BY neighbourhood")
+        self.borough_neighbourhoods = pairs.groupby("borough")["neighbourhood"].agg(list).to_dict()
+
+        first, last = connection().execute("SELECT MIN(last_review), MAX(last_review) FROM listings").fetchone()
+        self._date_range = None if first is None else (pd.Timestamp(first).date(), pd.Timestamp(last).date())
+
+    def date_range(self):
+        return self._date_range
+
+
+class SqlStore:
+    """Key Findings tables for a selection, looked up like the aggregate store and built by queries."""
+
+    def __init__(self, version, selection=None):
+        self.version = version
+        self.selection = selection
+        self._tables = {}
+        self._lock = threading.Lock()
+
+    def __getitem__(self, name):
+        with self._lock:
+            if name not in self._tables:
+                self._tables.update(build_section(aggregates.section_of(name), self.selection))
+            return self._tables[name]
+
+    def listings(self, names=None):
+        return columns(names, self.selection)
+
+    def listing_count(self):
+        return listing_count(self.selection)
+
+
+if __name__ == "__main__":
+    path, version = ensure_database()
+    print(f"Loaded {listing_count():,} listings from {data_loader.LISTINGS_FILE} ({version}) into {path}")
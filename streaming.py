@@ -0,0 +1,258 @@
+"""
+Out-of-core build of the Key Findings tables.
+
+    python streaming.py [--chunksize ROWS]
+
+For listing files too large to load, this reads the CSV CHUNKSIZE rows at a
+time (with the change log of refresh.py applied, see data_loader) and folds
+each chunk into partial aggregates that add up across chunks:
+
+  * the state cubes behind the Room Types, Boroughs, Price Ranges, time series
+    and Reviews tables, which are sums and counts per group and per day;
+  * per grid cell sums for the map clusters (see geo.cell_sums);
+  * counts, sums and sums of squares of prices per (borough, room_type) for
+    the means and standard deviations, and the count of every distinct price
+    for the quartiles, median, mode and outliers;
+  * sums and sums of squares and products for the scatter correlation.
+
+A second pass over just the scatter columns bins them with the edges found in
+the first pass and draws the stratified sample, whose group sizes are only
+known then. Memory is bounded by the chunk size plus the number of groups,
+days, grid cells and distinct prices, never by the number of listings.
+
+The tables equal those of aggregates.build_aggregates up to floating point
+rounding. The one exception: when the distinct prices outgrow
+MAX_PRICE_VALUES, the price counts are folded into logarithmic buckets. The
+quartiles, median and mode are then within SKETCH_ERROR (relative) of the
+exact figures, and the IQR and outlier count are computed from those
+approximations. Count, mean, std, min and max stay exact.
+
+The tables are written to the aggregate store for the current listings file,
+where the app reads them without loading the listings, together with the
+cell sums and exact price counts that refresh.py patches. Sketched price
+counts are not stored, so the first refresh after a sketched build counts
+the prices again from the listings.
+"""
+
+import argparse
+import resource
+
+import numpy as np
+import pandas as pd
+
+import aggregates
+import data_loader
+import downsample
+import geo
+import price_stats
+
+CHUNKSIZE = 250_000
+
+# Distinct (borough, room_type, price) counts kept before they become a sketch
+MAX_PRICE_VALUES = 200_000
+
+# Relative error of a price quantile once the counts are bucketed
+SKETCH_ERROR = 0.001
+
+SCATTER_COLUMNS = ["booked_days_365", "price", "borough"]
+PRICE_GROUPS = ["borough", "room_type"]
+
+
+def _add(total, partial, keys):
+    """Sum two partial tables on their key columns."""
+    if total is None:
+        return partial
+    return pd.concat([total, partial], ignore_index=True).groupby(keys, observed=True, dropna=False).sum().reset_index()
+
+
+def _categorise(table):
+    """Categorical dimensions as the in-memory builders have them."""
+    for column in data_loader.CATEGORY_COLUMNS:
+        if column in table:
+            table[column] = table[column].astype(object).astype("category")
+    if "price_range" in table:
+        table["price_range"] = pd.Categorical(table["price_range"], categories=data_loader.PRICE_LABELS, ordered=True)
+    return table
+
+
+def bucket_prices(prices, error=SKETCH_ERROR):
+    """Positive prices moved to the middle of logarithmic buckets, each within error of its price."""
+    gamma = (1 + error) / (1 - error)
+    prices = np.asarray(prices, dtype=np.float64)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        buckets = 2 * gamma ** np.ceil(np.log(prices) / np.log(gamma)) / (gamma + 1)
+    return np.where(prices > 0, buckets, prices)
+
+
+class Partials:
+    """Running partial aggregates of the listings seen so far."""
+
+    def __init__(self):
+        self.rows = 0
+        self.state = {"state_cube": None, "state_daily": None}
+        self.cells = dict.fromkeys(geo.ZOOM_LEVELS)
+        self.price_counts = None
+        self.price_moments = None
+        self.sketched = False
+        self.scatter_sums = np.zeros(6)
+        self.scatter_range = [np.inf, -np.inf, np.inf, -np.inf]
+        self.borough_sizes = None
+
+    def add(self, chunk):
+        self.rows += len(chunk)
+
+        state = aggregates.build_state(chunk)
+        self.state["state_cube"] = _add(self.state["state_cube"], state["state_cube"], aggregates.STATE_DIMS)
+        self.state["state_daily"] = _add(self.state["state_daily"], state["state_daily"], aggregates.DAILY_DIMS)
+
+        for level, cell_size in geo.ZOOM_LEVELS.items():
+            self.cells[level] = _add(self.cells[level], geo.cell_sums(chunk, cell_size), ["row", "col"])
+
+        self._add_prices(chunk)
+        self._add_scatter(chunk)
+
+    def _add_prices(self, chunk):
+        counts = price_stats.value_counts(chunk, PRICE_GROUPS)
+        if self.sketched:
+            counts["price"] = bucket_prices(counts["price"])
+        self.price_counts = _add(self.price_counts, counts, PRICE_GROUPS + ["price"])
+        if len(self.price_counts) > MAX_PRICE_VALUES and not self.sketched:
+            self.sketched = True
+            self.price_counts["price"] = bucket_prices(self.price_counts["price"])
+            self.price_counts = self.price_counts.groupby(PRICE_GROUPS + ["price"], observed=True, dropna=False).sum().reset_index()
+
+        prices = chunk[PRICE_GROUPS].assign(price=chunk["price"], square=chunk["price"] ** 2)
+        grouped = prices.groupby(PRICE_GROUPS, observed=True, dropna=False)
+        moments = grouped[["price", "square"]].sum().rename(columns={"price": "sum"})
+        moments["count"] = grouped["price"].count()
+        moments["min"] = grouped["price"].min()
+        moments["max"] = grouped["price"].max()
+        moments = moments.reset_index()
+        if self.price_moments is None:
+            self.price_moments = moments
+        else:
+            merged = pd.concat([self.price_moments, moments], ignore_index=True).groupby(PRICE_GROUPS, observed=True, dropna=False)
+            self.price_moments = merged.agg({"sum": "sum", "square": "sum", "count": "sum",
+                                             "min": "min", "max": "max"}).reset_index()
+
+    def _add_scatter(self, chunk):
+        x = chunk["booked_days_365"].to_numpy(dtype=np.float64)
+        y = chunk["price"].to_numpy(dtype=np.float64)
+        valid = ~(np.isnan(x) | np.isnan(y))
+        x, y = x[valid], y[valid]
+        self.scatter_sums += [len(x), x.sum(), y.sum(), (x * x).sum(), (y * y).sum(), (x * y).sum()]
+        if len(x):
+            low_x, high_x, low_y, high_y = self.scatter_range
+            self.scatter_range = [min(low_x, x.min()), max(high_x, x.max()), min(low_y, y.min()), max(high_y, y.max())]
+
+        sizes = chunk.groupby("borough", observed=True).size()
+        sizes.index = sizes.index.astype(object)
+        self.borough_sizes = sizes if self.borough_sizes is None else self.borough_sizes.add(sizes, fill_value=0)
+
+    def state_tables(self):
+        return {name: _categorise(table) for name, table in self.state.items()}
+
+    def map_tables(self):
+        tables = {aggregates.map_table(level): geo.clusters_from_sums(cells) for level, cells in self.cells.items()}
+        tables.update({aggregates.map_cells_table(level): cells for level, cells in self.cells.items()})
+        return tables
+
+    def price_table(self):
+        table = price_stats.stats_table_from_counts(self.price_counts, PRICE_GROUPS)
+        if not self.sketched:
+            return {"price_stats": table, "price_counts": _categorise(self.price_counts)}
+
+        # Bucketed counts give the order statistics, the moments the rest
+        rows = [("all", "all", self.price_moments)]
+        for key in PRICE_GROUPS:
+            for group, moments in self.price_moments.groupby(key, observed=True):
+                rows.append((key, str(group), moments))
+        for group_by, group, moments in rows:
+            n = moments["count"].sum()
+            total, square = moments["sum"].sum(), moments["square"].sum()
+            row = (table["group_by"] == group_by) & (table["group"] == group)
+            table.loc[row, "mean"] = total / n if n else np.nan
+            table.loc[row, "std"] = np.sqrt((square - total * total / n) / (n - 1)) if n > 1 else np.nan
+            table.loc[row, "min"] = moments["min"].min()
+            table.loc[row, "max"] = moments["max"].max()
+        table["range"] = table["max"] - table["min"]
+        return {"price_stats": table}
+
+    def correlation(self):
+        n, sx, sy, sxx, syy, sxy = self.scatter_sums
+        covariance = sxy - sx * sy / n
+        return covariance / np.sqrt((sxx - sx * sx / n) * (syy - sy * sy / n))
+
+
+def scatter_tables(partials, path, chunksize=CHUNKSIZE):
+    """The scatter tables, from a second pass over the scatter columns."""
+    low_x, high_x, low_y, high_y = partials.scatter_range
+    x_edges = downsample.bin_edges(low_x, high_x, 37)
+    y_edges = downsample.bin_edges(low_y, high_y, 40, log=True)
+
+    sizes = partials.borough_sizes.sort_index().astype(np.int64)
+    keep_all = partials.rows <= aggregates.SCATTER_SAMPLE_SIZE
+    if not keep_all:
+        picks = downsample.stratified_picks(sizes, partials.rows, aggregates.SCATTER_SAMPLE_SIZE)
+        picks = {value: np.sort(ordinals) for value, ordinals in picks.items()}
+    seen = dict.fromkeys(sizes.index, 0)
+
+    counts, sample = None, []
+    for chunk in data_loader.read_listings_chunks(path, chunksize, columns=SCATTER_COLUMNS):
+        binned = downsample.bin_counts(chunk, "booked_days_365", "price", x_edges, y_edges, color="borough")
+        binned["borough"] = binned["borough"].astype(object)
+        counts = _add(counts, binned, ["x_bin", "y_bin", "borough"])
+
+        if keep_all:
+            sample.append(chunk)
+            continue
+        # Keep the rows whose ordinal within their borough was picked
+        boroughs = chunk["borough"].astype(object).to_numpy()
+        keep = np.zeros(len(chunk), dtype=bool)
+        for value in seen:
+            rows = np.flatnonzero(boroughs == value)
+            ordinals = seen[value] + np.arange(len(rows))
+            keep[rows[np.isin(ordinals, picks[value])]] = True
+            seen[value] += len(rows)
+        sample.append(chunk[keep])
+
+    counts = counts.sort_values(["x_bin", "y_bin", "borough"]).reset_index(drop=True)
+    counts["borough"] = counts["borough"].astype("category")
+    sample = _categorise(pd.concat(sample, ignore_index=True))
+    return {
+        "scatter_correlation": pd.DataFrame({"correlation": [partials.correlation()]}),
+        "scatter_bins": downsample.label_bins(counts, "booked_days_365", "price", x_edges, y_edges,
+                                              color="borough", y_log=True),
+        "scatter_sample": sample,
+    }
+
+
+def build_aggregates(path=None, chunksize=CHUNKSIZE):
+    """Every Key Findings table for a listings CSV, without loading it whole."""
+    path = path or data_loader.data_path(data_loader.LISTINGS_FILE)
+    partials = Partials()
+    for chunk in data_loader.read_listings_chunks(path, chunksize):
+        partials.add(chunk)
+
+    tables = partials.state_tables()
+    tables.update(aggregates.derive_from_state(tables["state_cube"], tables["state_daily"]))
+    tables.update(partials.map_tables())
+    tables.update(partials.price_table())
+    tables.update(scatter_tables(partials, path, chunksize))
+    return tables
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build the aggregate store chunk by chunk.")
+    parser.add_argument("--chunksize", type=int, default=CHUNKSIZE, help="listings read at a time")
+    args = parser.parse_args()
+
+    version = data_loader.dataset_version()
+    path = aggregates.write_aggregates(build_aggregates(chunksize=args.chunksize), version)
+    # ru_maxrss is in kilobytes on Linux
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    print(f"Wrote aggregates for {data_loader.LISTINGS_FILE} ({version}) to {path}, peak memory {peak:.0f} MB")
+
+
+if __name__ == "__main__":
+    main()
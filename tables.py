@@ -0,0 +1,114 @@
+"""
+"View Data" tables with a Blues background gradient.
+
+This replaces df.style.background_gradient(cmap="Blues"). The colours come
+from the nine anchor colours of matplotlib's Blues map, interpolated with
+NumPy over each numeric column's full range, and the tables are written out
+as HTML here, so neither pandas' Styler nor matplotlib is imported. Tables
+longer than a page are paginated on the server and only the visible page is
+coloured and sent to the browser.
+"""
+
+import html
+
+import numpy as np
+import pandas as pd
+import streamlit as st
+
+# The anchor colours of matplotlib's "Blues" colormap, light to dark
+BLUES = np.array([
+    [247, 251, 255], [222, 235, 247], [198, 219, 239], [158, 202, 225], [107, 174, 214],
+    [66, 146, 198], [33, 113, 181], [8, 81, 156], [8, 48, 107],
+]) / 255
+
+# Rows per page
+PAGE_SIZE = 25
+
+# Same text colour rule as Styler.background_gradient
+TEXT_COLOR_THRESHOLD = 0.408
+
+# Decimals shown for floats
+PRECISION = 2
+
+
+def gradient_colors(values, vmin, vmax):
+    """RGB rows in [0, 1] for values scaled between vmin and vmax."""
+    values = np.asarray(values, dtype=np.float64)
+    if vmax > vmin:
+        scaled = (values - vmin) / (vmax - vmin)
+    else:
+        scaled = np.zeros_like(values)
+    # Snap to the 256 colour steps a matplotlib colormap has
+    scaled = np.clip(np.floor(scaled * 256), 0, 255) / 255
+    anchors = np.linspace(0, 1, len(BLUES))
+    return np.stack([np.interp(scaled, anchors, BLUES[:, channel]) for channel in range(3)], axis=-1)
+
+
+def relative_luminance(rgb):
+    linear = np.where(rgb <= 0.03928, rgb / 12.92, ((rgb + 0.055) / 1.055) ** 2.4)
+    return linear @ np.array([0.2126, 0.7152, 0.0722])
+
+
+def gradient_css(page, ranges):
+    """CSS for every cell of page, coloured against the (min, max) of each column in ranges."""
+    css = pd.DataFrame("", index=page.index, columns=page.columns)
+    for column, (vmin, vmax) in ranges.items():
+        values = page[column].to_numpy(dtype=np.float64, na_value=np.nan)
+        rgb = gradient_colors(values, vmin, vmax)
+        dark = relative_luminance(rgb) < TEXT_COLOR_THRESHOLD
+        hexes = ["#{:02x}{:02x}{:02x}".format(*c) for c in np.rint(rgb * 255).astype(int)]
+        css[column] = [
+            "" if np.isnan(value) else f"background-color: {color}; color: {'#f1f1f1' if is_dark else '#000000'};"
+            for value, color, is_dark in zip(values, hexes, dark)
+        ]
+    return css
+
+
+def numeric_ranges(data):
+    """(min, max) of every numeric column, the scale of its gradient."""
+    columns = [c for c in data.columns
+               if pd.api.types.is_numeric_dtype(data[c]) and not pd.api.types.is_bool_dtype(data[c])]
+    return {c: (data[c].min(), data[c].max()) for c in columns}
+
+
+def gradient_table(data, key, page_size=PAGE_SIZE):
+    """Render data with a Blues gradient, one page at a time."""
+    ranges = numeric_ranges(data)
+    pages = max(-(-len(data) // page_size), 1)
+    page_number = 1
+    if pages > 1:
+        # The table may have shrunk since the page was picked (another filter or resolution).
+        # No value=, the page starts at min_value: Streamlit warns when a widget has both.
+        if st.session_state.get(key, 1) > pages:
+            st.session_state[key] = pages
+        page_number = st.number_input("Page", min_value=1, max_value=pages, key=key)
+
+    start = (page_number - 1) * page_size
+    page = data.iloc[start:start + page_size]
+    st.markdown(html_table(page, gradient_css(page, ranges)), unsafe_allow_html=True)
+    if pages > 1:
+        st.caption(f"Rows {start + 1:,} to {start + len(page):,} of {len(data):,}")
+
+
+def _cell_text(value):
+    if isinstance(value, (float, np.floating)):
+        return "" if np.isnan(value) else f"{value:.{PRECISION}f}"
+    return "" if value is None or value is pd.NaT else html.escape(str(value))
+
+
+def html_table(page, css):
+    """page as an HTML table, each cell styled with the matching entry of css."""
+    header = "".join(f"<th>{html.escape(str(column))}</th>" for column in page.columns)
+    rows = []
+    for label, values, styles in zip(page.index, page.itertuples(index=False), css.itertuples(index=False)):
+        cells = "".join(f'<td style="{style}">{_cell_text(value)}</td>' if style else f"<td>{_cell_text(value)}</td>"
+                        for value, style in zip(values, styles))
+        rows.append(f"<tr><th>{html.escape(str(label))}</th>{cells}</tr>")
+    # Wide tables scroll instead of squeezing the page
+    return (f'<div style="overflow-x: auto;"><table><thead><tr><th></th>{header}</tr></thead>'
+            f'<tbody>{"".join(rows)}</tbody></table></div>')
+
+
+def gradient_html(data):
+    """All of data as an HTML table with the same gradient, for the static report."""
+    return html_table(data, gradient_css(data, numeric_ranges(data)))
@@ -0,0 +1,69 @@
+"""
+Booked days over time at day, week, month and quarter resolution.
+
+The daily totals per category are rolled up to every granularity once, when
+the aggregates are built, into one long table per category (room type and
+price range) with a "granularity" column. Charts pick the coarsest resolution
+that still shows enough points for the visible date range and take the rows
+of that granularity, so switching resolution never touches the listings and
+the number of points per line is bounded by MAX_PERIODS.
+"""
+
+import pandas as pd
+
+# Granularity -> pandas period frequency, finest first
+GRANULARITIES = {
+    "Day": "D",
+    "Week": "W",
+    "Month": "M",
+    "Quarter": "Q",
+}
+
+# Most points per line before auto picks a coarser granularity
+MAX_PERIODS = 60
+
+MEASURE = "booked_days_365"
+
+
+def rollup(daily, dim):
+    """
+    Sum MEASURE per period and dim value at every granularity.
+
+    daily has one row per last_review day (or more, they are summed) with dim
+    and MEASURE columns. Each period is labelled by its first day.
+    """
+    days = pd.to_datetime(daily["last_review"])
+    tables = []
+    for granularity, freq in GRANULARITIES.items():
+        period = days.dt.to_period(freq).dt.start_time
+        table = daily.groupby([period, daily[dim]], observed=True)[MEASURE].sum().reset_index()
+        table.insert(0, "granularity", granularity)
+        tables.append(table)
+    return pd.concat(tables, ignore_index=True)
+
+
+def rollup_name(dim):
+    return f"booked_days_by_{dim}"
+
+
+def periods(start, end, granularity):
+    """Number of periods of a granularity between two dates."""
+    freq = GRANULARITIES[granularity]
+    return pd.Period(end, freq).ordinal - pd.Period(start, freq).ordinal + 1
+
+
+def auto_granularity(start, end, max_periods=MAX_PERIODS):
+    """The finest granularity that keeps the range within max_periods points."""
+    for granularity in GRANULARITIES:
+        if periods(start, end, granularity) <= max_periods:
+            return granularity
+    return list(GRANULARITIES)[-1]
+
+
+def series(table, granularity="Auto"):
+    """Rows of a rollup table at one granularity, resolving "Auto" from its date range."""
+    days = table[table["granularity"] == "Day"]["last_review"]
+    if granularity == "Auto":
+        granularity = auto_granularity(days.min(), days.max()) if len(days) else "Day"
+    rows = table[table["granularity"] == granularity].drop(columns="granularity")
+    return rows.reset_index(drop=True), granularity